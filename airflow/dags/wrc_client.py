@@ -0,0 +1,90 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+# thin client for the resident scraper/transformer services (src/server.py in each project), used by the dag.
+# `measure` also runs the same job through the cli to compare a cold process with the warm service:
+#   python wrc_client.py measure --url http://localhost:8082 --cwd ../../transformer --param start_date=01/10/2025 --param end_date=01/11/2025
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(url, data=data, method='POST' if data else 'GET', headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def submit_job(url, params):
+    return _request(f"{url.rstrip('/')}/jobs", params)
+
+def get_job(url, job_id):
+    return _request(f"{url.rstrip('/')}/jobs/{job_id}")
+
+def health(url):
+    return _request(f"{url.rstrip('/')}/health")
+
+def run_job(url, params, poll_interval=2.0, timeout=None):
+    # submits a job and waits for it, raises when it fails so the airflow task fails (and retries) with it
+    job = submit_job(url, params)
+    started = time.monotonic()
+    while job['status'] in ('queued', 'running'):
+        if timeout and time.monotonic() - started > timeout:
+            raise TimeoutError(f"job {job['id']} still {job['status']} after {timeout}s")
+        time.sleep(poll_interval)
+        job = get_job(url, job['id'])
+    if job['status'] != 'done':
+        raise RuntimeError(f"job {job['id']} {job['status']}: {job.get('error')}")
+    return job
+
+def cli_args(params):
+    # job params are the cli flags of the same name
+    args = []
+    for name, value in params.items():
+        if value is True:
+            args.append(f"--{name}")
+        elif value not in (None, False, ''):
+            args.extend([f"--{name}", ','.join(value) if isinstance(value, list) else str(value)])
+    return args
+
+def measure(url, params, cwd, runs):
+    # wall clock of the same job as a fresh `python -m src.main` process and through the service, alternated.
+    # the first pair also warms the http cache / memos, compare the medians
+    cold, warm = [], []
+    for i in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'src.main', *cli_args(params)], cwd=cwd, check=True, capture_output=True)
+        cold.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        run_job(url, params, poll_interval=0.2)
+        warm.append(time.perf_counter() - started)
+        print(f"run {i + 1}: cli {cold[-1]:.2f}s, service {warm[-1]:.2f}s")
+
+    print(f"median: cli {statistics.median(cold):.2f}s, service {statistics.median(warm):.2f}s")
+    print(f"service startup (paid once): {health(url).get('startup')}")
+
+def main():
+    parser = argparse.ArgumentParser(description='wrc service client')
+    parser.add_argument('command', choices=['run', 'measure', 'health'])
+    parser.add_argument('--url', required=True, help='service url, e.g. http://localhost:8081')
+    parser.add_argument('--param', action='append', default=[], help='job parameter as name=value (repeatable), value true for flags')
+    parser.add_argument('--cwd', default='.', help='project folder to run the cli from (measure)')
+    parser.add_argument('--runs', type=int, default=3, help='number of cli/service runs (measure)')
+    args = parser.parse_args()
+
+    params = {}
+    for param in args.param:
+        name, _, value = param.partition('=')
+        params[name] = True if value.lower() == 'true' else value
+
+    if args.command == 'run':
+        print(json.dumps(run_job(args.url, params), indent=2))
+    elif args.command == 'measure':
+        measure(args.url, params, args.cwd, args.runs)
+    else:
+        print(json.dumps(health(args.url), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,23 @@
 from airflow import DAG
-from airflow.providers.standard.operators.bash import BashOperator
+from airflow.sdk import task, task_group
+import importlib.util
+import os
 import pendulum
-from datetime import timedelta
+import shlex
+import wrc_client
+from datetime import datetime, timedelta
+
+# the partitions are computed with the scraper's own date_utils so both always agree on the monthly boundaries
+DATE_UTILS_PATH = os.getenv('WRC_DATE_UTILS_PATH', '/opt/airflow/scarper/src/utils/date_utils.py')
+# how many partitions are scraped / transformed at the same time (per dag run)
+MAX_PARALLEL_SCRAPERS = int(os.getenv('WRC_MAX_PARALLEL_SCRAPERS', '2'))
+MAX_PARALLEL_TRANSFORMERS = int(os.getenv('WRC_MAX_PARALLEL_TRANSFORMERS', '2'))
+MAX_PARALLEL_EXPORTS = int(os.getenv('WRC_MAX_PARALLEL_EXPORTS', '1'))
+# resident services (src/server.py), when set the tasks submit their job there instead of starting a new process
+SCRAPER_SERVICE_URL = os.getenv('WRC_SCRAPER_SERVICE_URL')
+TRANSFORMER_SERVICE_URL = os.getenv('WRC_TRANSFORMER_SERVICE_URL')
+# a partition's scraper/transformer/export task fails (and retries) when it runs longer than this
+TASK_TIMEOUT = timedelta(minutes=int(os.getenv('WRC_TASK_TIMEOUT_MINUTES', '120')))
 
 default_args = {
     'owner': 'darsa',
@@ -10,8 +26,23 @@ default_args = {
     'email_on_retry': False,
     'retries': 1,
     'retry_delay': timedelta(minutes=1),
+    'execution_timeout': TASK_TIMEOUT,
 }
 
+def job_timeout(ti):
+    # a service job is given a bit less than the task's execution_timeout, so the task fails with the job's id
+    # instead of being killed while it waits
+    timeout = ti.task.execution_timeout
+    if not timeout:
+        return None
+    return max(timeout.total_seconds() - 60, timeout.total_seconds() / 2)
+
+def load_date_utils():
+    spec = importlib.util.spec_from_file_location('wrc_date_utils', DATE_UTILS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 with DAG(
     'wrc_pipeline',
     default_args=default_args,
@@ -19,6 +50,7 @@ with DAG(
     schedule=None,
     start_date=pendulum.today('UTC').add(days=-1),
     tags=['wrc', 'pipeline'],
+    max_active_tasks=MAX_PARALLEL_SCRAPERS + MAX_PARALLEL_TRANSFORMERS + MAX_PARALLEL_EXPORTS,
     params={
         'start_date': '01/10/2025',
         'end_date': '01/12/2025',
@@ -26,27 +58,69 @@ with DAG(
     }
 ) as dag:
 
-    params = "{{ params }}"
-    
-    run_scraper = BashOperator(
-        task_id='run_scraper',
-        bash_command="""
-        cd /opt/airflow/scarper && \
-        python -m src.main \
-        --from_date '{{ params.start_date }}' \
-        --to_date '{{ params.end_date }}' \
-        --q '{{ params.query }}'
-        """
-    )
-
-    run_transformer = BashOperator(
-        task_id='run_transformer',
-        bash_command="""
-        cd /opt/airflow/transformer && \
-        python -m src.main \
-        --start_date '{{ params.start_date }}' \
-        --end_date '{{ params.end_date }}'
-        """
-    )
-
-    run_scraper >> run_transformer
+    @task
+    def compute_partitions(params=None):
+        date_utils = load_date_utils()
+        start_date = datetime.strptime(params['start_date'], "%d/%m/%Y")
+        end_date = datetime.strptime(params['end_date'], "%d/%m/%Y")
+        return [
+            {
+                'partition': r_start.strftime("%m-%Y"),
+                'from_date': r_start.strftime("%d/%m/%Y"),
+                'to_date': r_end.strftime("%d/%m/%Y"),
+            }
+            for r_start, r_end in date_utils.generate_date_ranges(start_date, end_date)
+        ]
+
+    # each partition is its own scraper -> transformer pair, so a partition is transformed as soon as it's
+    # scraped while the next ones are still being scraped, and a failed partition is retried on its own
+    if SCRAPER_SERVICE_URL:
+        @task(max_active_tis_per_dagrun=MAX_PARALLEL_SCRAPERS)
+        def run_scraper(partition, params=None, ti=None):
+            return wrc_client.run_job(SCRAPER_SERVICE_URL, {
+                'from_date': partition['from_date'],
+                'to_date': partition['to_date'],
+                'q': params['query'],
+                'resume': True,
+            }, timeout=job_timeout(ti))
+    else:
+        @task.bash(max_active_tis_per_dagrun=MAX_PARALLEL_SCRAPERS)
+        def run_scraper(partition, params=None):
+            return (
+                "cd /opt/airflow/scarper && python -m src.main"
+                f" --from_date {shlex.quote(partition['from_date'])}"
+                f" --to_date {shlex.quote(partition['to_date'])}"
+                f" --q {shlex.quote(params['query'])}"
+                " --resume"
+            )
+
+    if TRANSFORMER_SERVICE_URL:
+        @task(max_active_tis_per_dagrun=MAX_PARALLEL_TRANSFORMERS)
+        def run_transformer(partition, ti=None):
+            return wrc_client.run_job(TRANSFORMER_SERVICE_URL, {
+                'start_date': partition['from_date'],
+                'end_date': partition['to_date'],
+            }, timeout=job_timeout(ti))
+    else:
+        @task.bash(max_active_tis_per_dagrun=MAX_PARALLEL_TRANSFORMERS)
+        def run_transformer(partition):
+            return (
+                "cd /opt/airflow/transformer && python -m src.main"
+                f" --start_date {shlex.quote(partition['from_date'])}"
+                f" --end_date {shlex.quote(partition['to_date'])}"
+            )
+
+    # parquet export of the partition for analytics (transformer/src/export.py), only new or reprocessed records
+    @task.bash(max_active_tis_per_dagrun=MAX_PARALLEL_EXPORTS)
+    def run_export(partition):
+        return (
+            "cd /opt/airflow/transformer && python -m src.export"
+            f" --start_date {shlex.quote(partition['from_date'])}"
+            f" --end_date {shlex.quote(partition['to_date'])}"
+        )
+
+    @task_group
+    def process_partition(partition):
+        run_scraper(partition) >> run_transformer(partition) >> run_export(partition)
+
+    process_partition.expand(partition=compute_partitions())
@@ -1,20 +1,50 @@
 import argparse
+import re
 import scrapy
 import logging
 from datetime import datetime
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
 from src.models.case import Case
 from src.settings import get_settings
-from src.utils.date_utils import generate_date_ranges
+from src.utils.clients import mongo_client
+from src.utils.crawl_state import CrawlState, job_id_for, records_failed, records_stored
+from src.utils.date_utils import generate_date_ranges, merge_ranges, parse_published_date, partition_for, split_range
+
+# body name -> search form checkbox
+# first time I noticed about how .NET forms name the fields
+BODY_CHECKBOXES = {
+    'Employment Appeals Tribunal': ('ctl00$ContentPlaceHolder_Main$CB2$CB2_0', '2'),
+    'Equality Tribunal': ('ctl00$ContentPlaceHolder_Main$CB2$CB2_1', '1'),
+    'Labour Court': ('ctl00$ContentPlaceHolder_Main$CB2$CB2_2', '3'),
+    'Workplace Relations Commission': ('ctl00$ContentPlaceHolder_Main$CB2$CB2_3', '4'),
+}
+
+# "... of 1,234 results" on the results page and the page number in pager links
+RESULT_COUNT_PATTERN = re.compile(r'of\s+([\d,]+)\s+results?', re.IGNORECASE)
+PAGE_PARAM_PATTERN = re.compile(r'(page\w*=)(\d+)', re.IGNORECASE)
+# asp.net pagers that post the form back instead of linking: javascript:__doPostBack('target','Page$3')
+POSTBACK_PATTERN = re.compile(r"__doPostBack\('([^']*)','([^']*)'\)")
+
+def page_number_of(href):
+    # page number a pager link points to, from the postback argument (Page$3) or the page query parameter
+    postback = POSTBACK_PATTERN.search(href)
+    if postback:
+        digits = re.search(r'\d+', postback.group(2))
+        return int(digits.group()) if digits else None
+    page_param = PAGE_PARAM_PATTERN.search(href)
+    return int(page_param.group(2)) if page_param else None
 
 class WrcSpider(scrapy.Spider):
     name = 'wrc'
     allowed_domains = ['workplacerelations.ie']
     start_urls = ['https://www.workplacerelations.ie/en/search/']
 
-    def __init__(self, q='', from_date='', to_date='', body_filter='', *args, **kwargs):
+    def __init__(self, q='', from_date='', to_date='', body_filter='', bodies='', incremental=False, adaptive=False, resume=False, *args, **kwargs):
         super(WrcSpider, self).__init__(*args, **kwargs)
         self.query = q
+        self.from_date = from_date
+        self.to_date = to_date
         try:
             self.start_date = datetime.strptime(from_date, "%d/%m/%Y")
             self.end_date = datetime.strptime(to_date, "%d/%m/%Y")
@@ -23,79 +53,414 @@ class WrcSpider(scrapy.Spider):
         else:
             self.ranges = generate_date_ranges(self.start_date, self.end_date)
             
-        self.body_filter = body_filter
+        # one spider can cover several bodies (single pass mode), or just one like before
+        if bodies:
+            self.body_filters = [b.strip() for b in bodies.split(',') if b.strip()]
+        else:
+            self.body_filters = [body_filter] if body_filter else []
+
+        # single pass bookkeeping, per search window (split windows stay in their parent's group): listing requests
+        # still in flight and the cases found so far. decisions are only requested once every body's listing of the
+        # window is done so each case is fetched once, already carrying all of its bodies
+        self.partitions = {}
+        # pages already requested per (window, body) so a page is never fetched twice
+        self.seen_pages = {}
+
+        # incremental mode: ref_number/url -> bodies of the cases already stored for these partitions
+        self.incremental = incremental
+        self.known_cases = {}
+
+        # adaptive partitioning, the limits come from the crawler settings (see from_crawler)
+        self.adaptive = adaptive
+        self.adaptive_merge_months = 3
+        self.adaptive_max_pages = 10
+        self.search_page = None
+
+        # checkpoints in mongo (see src/utils/crawl_state.py), resume continues an unfinished run of the same search
+        self.resume = resume
+        self.resuming = False
+        self.crawl_state = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(WrcSpider, cls).from_crawler(crawler, *args, **kwargs)
+        spider.adaptive_merge_months = crawler.settings.getint('ADAPTIVE_MERGE_MONTHS', 3)
+        spider.adaptive_max_pages = crawler.settings.getint('ADAPTIVE_MAX_PAGES', 10)
+
+        if crawler.settings.getbool('CRAWL_STATE_ENABLED'):
+            spider.crawl_state = CrawlState(
+                crawler.settings.get('MONGO_URI'),
+                crawler.settings.get('MONGO_DATABASE'),
+                job_id_for(spider.query, spider.from_date, spider.to_date, spider.adaptive),
+                ','.join(spider.body_filters) or 'all',
+                crawler.settings.getfloat('CRAWL_STATE_FLUSH_INTERVAL', 10.0),
+                crawler.settings.getint('CRAWL_STATE_MAX_DECISION_ATTEMPTS', 3)
+            )
+            crawler.signals.connect(spider.crawl_state.open, signal=signals.spider_opened)
+            crawler.signals.connect(spider.crawl_state.close, signal=signals.spider_closed)
+            crawler.signals.connect(spider.crawl_state.records_stored, signal=records_stored)
+            crawler.signals.connect(spider.crawl_state.records_failed, signal=records_failed)
+            crawler.signals.connect(spider.crawl_state.item_failed, signal=signals.item_error)
+            crawler.signals.connect(spider.crawl_state.item_failed, signal=signals.item_dropped)
+        return spider
+
+    @property
+    def single_pass(self):
+        return len(self.body_filters) > 1
 
     def parse(self, response):
         if not self.ranges:
              self.logger.warning("no valid date ranges to scrape.")
              return
 
-        for r_start, r_end in self.ranges:
-            s_str = r_start.strftime("%d/%m/%Y")
-            e_str = r_end.strftime("%d/%m/%Y")
-            
-            formlist = []
-            # only select the specific body for this spider instance
-            # first time I noticed about how .NET forms name the fields
-            if self.body_filter == 'Employment Appeals Tribunal':
-                formlist.append(('ctl00$ContentPlaceHolder_Main$CB2$CB2_0', '2'))
-            elif self.body_filter == 'Equality Tribunal':
-                formlist.append(('ctl00$ContentPlaceHolder_Main$CB2$CB2_1', '1'))
-            elif self.body_filter == 'Labour Court':
-                formlist.append(('ctl00$ContentPlaceHolder_Main$CB2$CB2_2', '3'))
-            elif self.body_filter == 'Workplace Relations Commission':
-                 formlist.append(('ctl00$ContentPlaceHolder_Main$CB2$CB2_3', '4'))
-            
-            formdata = {
-                'ctl00$ContentPlaceHolder_Main$TextBox1': self.query,
-                'ctl00$ContentPlaceHolder_Main$TextBox2': s_str,
-                'ctl00$ContentPlaceHolder_Main$TextBox3': e_str,
-            }
-            
-            for key, value in formlist:
-                 formdata[key] = value
-
-            self.logger.info(f"submitting search for partition {s_str} - {e_str} (body: {self.body_filter})")
-
-            yield scrapy.FormRequest.from_response(
-                response,
-                formid='form',
-                formdata=formdata,
-                clickdata={'name': 'ctl00$ContentPlaceHolder_Main$refine_btn'},
-                callback=self.parse_results,
-                meta={'partition_date': r_start.strftime("%m/%Y")},
-                dont_filter=True
-            )
+        self.resuming = self.resume and self.crawl_state is not None and self.crawl_state.load(self)
+
+        # a resumed run skips what's already stored like incremental mode does
+        if self.incremental or self.resuming:
+            self._load_known_cases()
 
+        # kept to build the searches of split windows later on
+        self.search_page = response
 
+        if self.resuming:
+            # decisions listed by the previous run that never made it to mongo
+            for pending in list(self.crawl_state.pending_decisions.values()):
+                if pending.get('ref_number') in self.known_cases or pending['url'] in self.known_cases:
+                    # stored after the last checkpoint was written
+                    self.crawl_state.records_stored([pending['url']])
+                    continue
+                yield self._decision_request(Case(**pending))
+
+        # adaptive mode starts with several partitions per search and splits the dense ones once their first page is in
+        windows = merge_ranges(self.ranges, self.adaptive_merge_months) if self.adaptive else self.ranges
+        bodies = self.body_filters if self.single_pass else [self.body_filters[0] if self.body_filters else '']
+
+        for r_start, r_end in windows:
+            group = r_start.strftime("%m/%Y")
+            if self.resuming and self.crawl_state.is_completed(group):
+                self.logger.info(f"partition {group} already listed, skipping it")
+                continue
+            if self.single_pass:
+                self.partitions[group] = {'pending': 0, 'cases': {}}
+            for body in bodies:
+                yield self._search_request(r_start, r_end, body, group)
+
+    def _search_request(self, r_start, r_end, body, group):
+        s_str = r_start.strftime("%d/%m/%Y")
+        e_str = r_end.strftime("%d/%m/%Y")
+
+        formdata = {
+            'ctl00$ContentPlaceHolder_Main$TextBox1': self.query,
+            'ctl00$ContentPlaceHolder_Main$TextBox2': s_str,
+            'ctl00$ContentPlaceHolder_Main$TextBox3': e_str,
+        }
+        
+        # only select the specific body for this search
+        if body in BODY_CHECKBOXES:
+            key, value = BODY_CHECKBOXES[body]
+            formdata[key] = value
+
+        self.logger.info(f"submitting search for partition {s_str} - {e_str} (body: {body})")
+
+        meta = {
+            'partition_date': r_start.strftime("%m/%Y"),
+            'group': group,
+            'window': (r_start, r_end),
+            'body': body,
+            'first_page': True,
+            # listings change with every new case, never cached (the pages after it inherit this)
+            'dont_cache': True,
+        }
+        if self.single_pass:
+            # each body keeps its own session like it had with one spider per body
+            meta['cookiejar'] = body
+            self.partitions[group]['pending'] += 1
+        if self.crawl_state:
+            self.crawl_state.listing_started(group)
+
+        return scrapy.FormRequest.from_response(
+            self.search_page,
+            formid='form',
+            formdata=formdata,
+            clickdata={'name': 'ctl00$ContentPlaceHolder_Main$refine_btn'},
+            callback=self.parse_results,
+            errback=self.listing_failed,
+            meta=meta,
+            dont_filter=True
+        )
 
     def parse_results(self, response):
         partition_date = response.meta.get('partition_date')
+        group = response.meta.get('group')
+        body = response.meta.get('body')
+
+        if self.adaptive and response.meta.get('first_page'):
+            sub_windows = self._split_if_dense(response)
+            if sub_windows:
+                # too many pages for one chain, this page is dropped and the finer windows are searched instead
+                for r_start, r_end in sub_windows:
+                    yield self._search_request(r_start, r_end, body, group)
+                yield from self._listing_finished(response.meta)
+                return
         
         for result in response.css('li.each-item'):
-             item = Case()
-             link = result.css('h2.title a::attr(href)').get()
-             if link:
-                 url = response.urljoin(link)
-                 item['url'] = url
-                 ref_num = result.css('span.refNO::text').get()
-                 item['ref_number'] = ref_num.strip() if ref_num else None
-                 item['published_date'] = result.css('span.date::text').get()
-                 item['description'] = result.css('p.description::text').get()
-                 item['partition_date'] = partition_date
-                 item['scraped_at'] = datetime.utcnow()
-                 item['body_filters'] = [self.body_filter] if self.body_filter else []
-                 
-                 # visit the page to get attachments
-                 yield scrapy.Request(
-                     url, 
-                     callback=self.parse_decision, 
-                     meta={'item': item}
-                 )
+             item = self._build_item(result, response, partition_date, body)
+             if item is None:
+                 continue
+
+             if self.single_pass:
+                 self._collect(group, item, body)
+                 continue
+
+             # visit the page to get attachments
+             yield from self._decision_or_merge(item)
         
+        yield from self._page_requests(response)
+
+        # fanned out pages can be skipped on resume (except the last one, it may follow "next" further)
+        if self.crawl_state and response.meta.get('fanned_out') and response.meta.get('page_number') != response.meta.get('fan_out_total'):
+            self.crawl_state.page_done(response.meta['window'], response.meta['page_number'])
+
+        yield from self._listing_finished(response.meta)
+
+    def _split_if_dense(self, response):
+        pages = self._page_count(response)
+        if pages is None or pages <= self.adaptive_max_pages:
+            return []
+        r_start, r_end = response.meta['window']
+        sub_windows = split_range(r_start, r_end, self.ranges)
+        if sub_windows:
+            self.logger.info(
+                f"{r_start.strftime('%d/%m/%Y')} - {r_end.strftime('%d/%m/%Y')} has {pages} pages, "
+                f"splitting into {len(sub_windows)} searches (body: {response.meta.get('body')})"
+            )
+        return sub_windows
+
+    def _page_count(self, response):
+        # total pages of a search, from the "x results" text when the page has it, otherwise the highest page in the pager
+        results_on_page = len(response.css('li.each-item'))
+        text = ' '.join(response.css('body *:not(script):not(style)::text').getall())
+        match = RESULT_COUNT_PATTERN.search(text)
+        if match and results_on_page:
+            total = int(match.group(1).replace(',', ''))
+            return -(-total // results_on_page)
+
+        numbers = []
+        for link in response.css('ul.pager li a'):
+            label = (link.css('::text').get() or '').strip()
+            if label.isdigit():
+                numbers.append(int(label))
+            page_param = PAGE_PARAM_PATTERN.search(link.attrib.get('href', ''))
+            if page_param:
+                numbers.append(int(page_param.group(2)))
+        return max(numbers) if numbers else None
+
+    def listing_failed(self, failure):
+        request = failure.request
+        self.logger.error(f"listing request failed {request.url}: {failure.value}")
+        yield from self._listing_finished(request.meta, failed=True)
+
+    def _listing_finished(self, meta, failed=False):
+        # a listing request is done (parsed or failed), updates the single pass bookkeeping and the checkpoint.
+        # the window's decisions are built (so checkpointed as pending) before the window counts as listed
+        decisions = list(self._listing_done(meta.get('group'))) if self.single_pass else []
+        if self.crawl_state:
+            self.crawl_state.listing_finished(meta.get('group'), failed)
+        yield from decisions
+
+    def _build_item(self, result, response, partition_date, body):
+        link = result.css('h2.title a::attr(href)').get()
+        if not link:
+            return None
+
+        item = Case()
+        item['url'] = response.urljoin(link)
+        ref_num = result.css('span.refNO::text').get()
+        item['ref_number'] = ref_num.strip() if ref_num else None
+        item['published_date'] = result.css('span.date::text').get()
+        item['published_at'] = parse_published_date(item['published_date'])
+        item['description'] = result.css('p.description::text').get()
+        # merged/split windows don't line up with partitions, the published date tells which partition the case is in
+        if self.adaptive:
+            item['partition_date'] = partition_for(item['published_at'], self.ranges) or partition_date
+        else:
+            item['partition_date'] = partition_date
+        item['scraped_at'] = datetime.utcnow()
+        item['body_filters'] = [body] if body else []
+        return item
+
+    def _load_known_cases(self):
+        # only cases that made it to minio count as known, the others are fetched again
+        partition_dates = sorted({r_start.strftime("%m/%Y") for r_start, _ in self.ranges})
+        client = mongo_client(self.settings.get('MONGO_URI'))
+        cursor = client[self.settings.get('MONGO_DATABASE')]['wrc_decisions'].find(
+            {'partition_date': {'$in': partition_dates}, 'file_path': {'$exists': True, '$ne': None}},
+            {'ref_number': 1, 'url': 1, 'body_filters': 1}
+        )
+        for doc in cursor:
+            bodies = set(doc.get('body_filters') or [])
+            for key in (doc.get('ref_number'), doc.get('url')):
+                if key:
+                    self.known_cases[key] = bodies
+        self.logger.info(f"incremental mode: {len(self.known_cases)} known keys in {len(partition_dates)} partitions")
+
+    def _decision_or_merge(self, item):
+        # known cases skip the decision page, only bodies we haven't seen them under are merged into mongo
+        bodies = self.known_cases.get(item['ref_number']) or self.known_cases.get(item['url'])
+        if bodies is None:
+            yield self._decision_request(item)
+            return
+
+        new_bodies = [b for b in item['body_filters'] if b not in bodies]
+        if new_bodies:
+            bodies.update(new_bodies)
+            yield Case(
+                ref_number=item['ref_number'],
+                url=item['url'],
+                body_filters=new_bodies,
+                skip_files=True
+            )
+
+    def _decision_request(self, item):
+        if self.crawl_state:
+            self.crawl_state.decision_pending(item)
+        return scrapy.Request(
+            item['url'], 
+            callback=self.parse_decision, 
+            errback=self.decision_failed,
+            meta={'item': item}
+        )
+
+    def decision_failed(self, failure):
+        # the retry middleware already gave up on it, try again a few times (counted across resumes) then park it
+        request = failure.request
+        url = request.meta['item']['url']
+        if self.crawl_state is None:
+            self.logger.error(f"decision {url} failed: {failure.value!r}")
+            return
+        if self.crawl_state.decision_failed(url, repr(failure.value)):
+            self.logger.warning(f"decision {url} failed ({failure.value!r}), requesting it again")
+            yield request.replace(dont_filter=True)
+        else:
+            self.logger.error(f"decision {url} failed {self.crawl_state.max_decision_attempts} times, parked it: {failure.value!r}")
+
+    def _page_requests(self, response):
+        # the first page of a search requests all the other pages at once, if the pager can't be read
+        # the chain falls back to following the "next" link page by page
+        if response.meta.get('first_page'):
+            fan_out = self._fan_out(response)
+            if fan_out is not None:
+                self.logger.debug(f"fanning out {len(fan_out)} pages (body: {response.meta.get('body')})")
+                for page_number, request in fan_out:
+                    if self._register_page(response, page_number):
+                        yield request
+                return
+
+        # fanned out pages stop there, except the last one which keeps following "next" in case the pager
+        # only showed part of the pages
+        if response.meta.get('fanned_out') and response.meta.get('page_number') != response.meta.get('fan_out_total'):
+            return
+
         next_page = response.css('ul.pager li:last-child a::attr(href)').get()
         if next_page:
-            yield response.follow(next_page, self.parse_results, meta=response.meta)
+            url = response.urljoin(next_page)
+            # keyed on the page number like the fanned out pages, so "next" never refetches one of them.
+            # a link without a readable number can only be deduped on its url
+            page_number = page_number_of(next_page)
+            if self._register_page(response, url if page_number is None else page_number):
+                meta = {**response.meta, 'first_page': False, 'fanned_out': False, 'page_number': page_number}
+                yield response.follow(url, self.parse_results, errback=self.listing_failed, meta=meta, dont_filter=True)
+
+    def _fan_out(self, response):
+        # (page number, request) for pages 2..n, None when there's no usable pager
+        total = self._page_count(response)
+        if total is None:
+            return None
+        if total <= 1:
+            return []
+
+        def page_meta(page_number):
+            return {**response.meta, 'first_page': False, 'fanned_out': True, 'page_number': page_number, 'fan_out_total': total}
+
+        for href in response.css('ul.pager li a::attr(href)').getall():
+            postback = POSTBACK_PATTERN.search(href)
+            if postback:
+                target, argument = postback.groups()
+                # same form and viewstate as the first page, only the event argument changes
+                return [
+                    (page_number, scrapy.FormRequest.from_response(
+                        response,
+                        formid='form',
+                        formdata={'__EVENTTARGET': target, '__EVENTARGUMENT': re.sub(r'\d+', str(page_number), argument)},
+                        dont_click=True,
+                        callback=self.parse_results,
+                        errback=self.listing_failed,
+                        meta=page_meta(page_number),
+                        dont_filter=True
+                    ))
+                    for page_number in range(2, total + 1)
+                ]
+
+            if PAGE_PARAM_PATTERN.search(href):
+                return [
+                    (page_number, scrapy.Request(
+                        response.urljoin(PAGE_PARAM_PATTERN.sub(lambda m: f"{m.group(1)}{page_number}", href, count=1)),
+                        callback=self.parse_results,
+                        errback=self.listing_failed,
+                        meta=page_meta(page_number),
+                        dont_filter=True
+                    ))
+                    for page_number in range(2, total + 1)
+                ]
+        return None
+
+    def _register_page(self, response, page_key):
+        # dupe guard per (window, body), keyed on the page number: the same page can legitimately show up for two
+        # bodies, but a chain never fetches a page twice. also counts the request for single pass bookkeeping
+        window = response.meta.get('window')
+        seen = self.seen_pages.get((window, response.meta.get('body')))
+        if seen is None:
+            seen = self.seen_pages[(window, response.meta.get('body'))] = {1} | self._checkpointed_pages(window)
+        if page_key in seen:
+            return False
+        seen.add(page_key)
+
+        if self.single_pass:
+            self.partitions[response.meta.get('group')]['pending'] += 1
+        if self.crawl_state:
+            self.crawl_state.listing_started(response.meta.get('group'))
+        return True
+
+    def _checkpointed_pages(self, window):
+        # fanned out pages parsed before a restart aren't requested again, their decisions are in the pending ones.
+        # single pass keeps listed cases in memory until the whole window is listed, so there a window starts over
+        if not self.resuming or self.single_pass:
+            return set()
+        return self.crawl_state.seen_pages(window)
+
+    def _collect(self, group, item, body):
+        cases = self.partitions[group]['cases']
+        key = item['ref_number'] or item['url']
+        if key in cases:
+            if body and body not in cases[key]['body_filters']:
+                cases[key]['body_filters'].append(body)
+        else:
+            cases[key] = item
+
+    def _listing_done(self, group):
+        partition = self.partitions.get(group)
+        if partition is None:
+            return
+        partition['pending'] -= 1
+        if partition['pending'] > 0:
+            return
+
+        # every body's listing of this window is done, fetch each case once
+        cases = self.partitions.pop(group)['cases']
+        self.logger.info(f"partition {group} listed, {len(cases)} unique cases across {len(self.body_filters)} bodies")
+        for item in cases.values():
+            item['body_filters'] = [b for b in self.body_filters if b in item['body_filters']]
+            yield from self._decision_or_merge(item)
 
     def parse_decision(self, response):
         item = response.meta['item']
@@ -121,14 +486,41 @@ class WrcSpider(scrapy.Spider):
             additional_files.append(full_url)
             
         item['additional_files'] = list(set(additional_files)) # deduplicate
+
+        # hand the page over to the minio pipeline, no need to download it a second time
+        item['page_body'] = response.body
+        item['page_headers'] = dict(response.headers.to_unicode_dict())
         yield item
 
+ALL_BODIES = [
+    'Employment Appeals Tribunal',
+    'Equality Tribunal',
+    'Labour Court',
+    'Workplace Relations Commission'
+]
+
+def start_crawls(runner, q='', from_date='', to_date='', bodies=None, single_pass=False, incremental=False, adaptive=False, resume=False):
+    # schedules the spiders of one scrape on a CrawlerProcess (cli) or a CrawlerRunner (src/server.py), returns their deferreds
+    bodies_list = bodies or ALL_BODIES
+    spider_args = dict(q=q, from_date=from_date, to_date=to_date, incremental=incremental, adaptive=adaptive, resume=resume)
+    if single_pass:
+        return [runner.crawl(WrcSpider, bodies=','.join(bodies_list), **spider_args)]
+    return [runner.crawl(WrcSpider, body_filter=body, **spider_args) for body in bodies_list]
+
 def main():
     parser = argparse.ArgumentParser(description='run wrc scrapy spider')
     parser.add_argument('--q', type=str, default='', help='search query')
     parser.add_argument('--from_date', type=str, default='', help='from date (dd/mm/yyyy)')
     parser.add_argument('--to_date', type=str, default='', help='to date (dd/mm/yyyy)')
     parser.add_argument('--bodies', type=str, default='', help='comma-separated list of bodies')
+    parser.add_argument('--incremental', action='store_true', help='skip decisions already stored for the requested partitions')
+    parser.add_argument('--adaptive', action='store_true', help='merge quiet partitions and split dense ones based on the result count')
+    parser.add_argument('--single_pass', action='store_true', help='one spider for all bodies, each decision is fetched once')
+    parser.add_argument('--no_throttle', action='store_true', help='disable the adaptive throttle (scrapy defaults)')
+    parser.add_argument('--target_latency', type=float, default=None, help='latency (seconds) the adaptive throttle aims for')
+    parser.add_argument('--max_concurrency', type=int, default=None, help='max concurrent requests per site for the adaptive throttle')
+    parser.add_argument('--no_cache', action='store_true', help='disable the shared http cache (everything is downloaded in full)')
+    parser.add_argument('--resume', action='store_true', help='continue the unfinished run of the same search from its checkpoint')
     parser.add_argument('--debug', action='store_true', help='enable debug logging')
     
     args = parser.parse_args()
@@ -143,21 +535,24 @@ def main():
         pass
 
     settings = get_settings(debug=args.debug)
+    # cli flags win over the env variables
+    if args.no_throttle:
+        settings['ADAPTIVE_THROTTLE_ENABLED'] = False
+    if args.target_latency is not None:
+        settings['ADAPTIVE_THROTTLE_TARGET_LATENCY'] = args.target_latency
+    if args.max_concurrency is not None:
+        settings['ADAPTIVE_THROTTLE_MAX_CONCURRENCY'] = args.max_concurrency
+        settings['CONCURRENT_REQUESTS_PER_DOMAIN'] = args.max_concurrency
+    if args.no_cache:
+        settings['HTTPCACHE_ENABLED'] = False
     process = CrawlerProcess(settings)
     
     # here I was confused if I should do all bodies (each in spider) or just the user should specify the bodies, so I did the logic for both.
-    if args.bodies:
-        bodies_list = [b.strip() for b in args.bodies.split(',')]
-    else:
-        bodies_list = [
-            'Employment Appeals Tribunal',
-            'Equality Tribunal',
-            'Labour Court',
-            'Workplace Relations Commission'
-        ]
-    
-    for body in bodies_list:
-        process.crawl(WrcSpider, q=args.q, from_date=args.from_date, to_date=args.to_date, body_filter=body)
+    bodies_list = [b.strip() for b in args.bodies.split(',')] if args.bodies else None
+    start_crawls(
+        process, q=args.q, from_date=args.from_date, to_date=args.to_date, bodies=bodies_list,
+        single_pass=args.single_pass, incremental=args.incremental, adaptive=args.adaptive, resume=args.resume
+    )
     
     process.start()
 
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# statuses that mean the site wants us to slow down
+BACKOFF_STATUSES = {429, 500, 502, 503, 504, 520, 522, 524}
+
+# AIMD control of each downloader slot's concurrency and delay. every `window` responses the slot is evaluated:
+# no errors and an average latency under the target -> concurrency + 1 and half the delay (additive increase),
+# errors (429/5xx/timeouts) or a latency over the target -> concurrency * decrease_factor, errors also double
+# the delay (multiplicative decrease)
+class AdaptiveThrottleMiddleware:
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.target_latency = settings.getfloat('ADAPTIVE_THROTTLE_TARGET_LATENCY', 2.0)
+        self.min_concurrency = settings.getint('ADAPTIVE_THROTTLE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 16)
+        self.start_concurrency = settings.getint('ADAPTIVE_THROTTLE_START_CONCURRENCY', 4)
+        self.min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.0)
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 30.0)
+        self.decrease_factor = settings.getfloat('ADAPTIVE_THROTTLE_DECREASE_FACTOR', 0.5)
+        self.window = settings.getint('ADAPTIVE_THROTTLE_WINDOW', 10)
+        self.log_interval = settings.getfloat('ADAPTIVE_THROTTLE_LOG_INTERVAL', 60.0)
+
+        # slot key -> samples collected since the last adjustment
+        self.samples = {}
+        self.log_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.log_loop = task.LoopingCall(self._log_limits, spider)
+        self.log_loop.start(self.log_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.log_loop and self.log_loop.running:
+            self.log_loop.stop()
+        self._log_limits(spider)
+
+    def process_response(self, request, response, spider):
+        latency = request.meta.get('download_latency')
+        # cached responses never reached the site, they say nothing about how it's doing
+        if latency is not None:
+            retry_after = response.headers.get('Retry-After') if response.status == 429 else None
+            self._record(request, spider, latency, error=response.status in BACKOFF_STATUSES, retry_after=retry_after)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # timeouts, connection resets... count as errors, the retry middleware decides what to do with the request
+        self._record(request, spider, None, error=True)
+        return None
+
+    def _get_slot(self, request):
+        key = request.meta.get('download_slot')
+        downloader = self.crawler.engine.downloader
+        return key, downloader.slots.get(key)
+
+    def _record(self, request, spider, latency, error, retry_after=None):
+        key, slot = self._get_slot(request)
+        if slot is None:
+            return
+
+        state = self.samples.get(key)
+        if state is None:
+            # first response from this slot, start from the configured concurrency
+            slot.concurrency = self.start_concurrency
+            slot.delay = max(slot.delay, self.min_delay)
+            state = self.samples[key] = {'latencies': [], 'errors': 0, 'retry_after': None}
+
+        if latency is not None:
+            state['latencies'].append(latency)
+        if error:
+            state['errors'] += 1
+            self.crawler.stats.inc_value('adaptive_throttle/errors')
+        if retry_after:
+            try:
+                state['retry_after'] = float(retry_after)
+            except ValueError:
+                pass
+
+        if len(state['latencies']) + state['errors'] >= self.window:
+            self._adjust(key, slot, state, spider)
+
+    def _adjust(self, key, slot, state, spider):
+        latencies = state['latencies']
+        avg_latency = sum(latencies) / len(latencies) if latencies else None
+        old_concurrency, old_delay = slot.concurrency, slot.delay
+
+        if state['errors']:
+            slot.concurrency = max(self.min_concurrency, int(slot.concurrency * self.decrease_factor))
+            slot.delay = min(self.max_delay, max(slot.delay * 2, 0.5, state['retry_after'] or 0))
+        elif avg_latency is not None and avg_latency > self.target_latency:
+            slot.concurrency = max(self.min_concurrency, int(slot.concurrency * self.decrease_factor))
+        else:
+            slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+            slot.delay = max(self.min_delay, slot.delay / 2)
+
+        if (slot.concurrency, slot.delay) != (old_concurrency, old_delay):
+            latency_str = f"{avg_latency:.2f}s" if avg_latency is not None else "n/a"
+            spider.logger.debug(
+                f"adaptive throttle {key}: concurrency {old_concurrency} -> {slot.concurrency}, "
+                f"delay {old_delay:.2f}s -> {slot.delay:.2f}s (latency {latency_str}, errors {state['errors']})"
+            )
+
+        stats = self.crawler.stats
+        stats.set_value(f'adaptive_throttle/{key}/concurrency', slot.concurrency)
+        stats.set_value(f'adaptive_throttle/{key}/delay', slot.delay)
+        if avg_latency is not None:
+            stats.set_value(f'adaptive_throttle/{key}/latency', round(avg_latency, 3))
+        stats.max_value(f'adaptive_throttle/{key}/max_concurrency', slot.concurrency)
+
+        state['latencies'] = []
+        state['errors'] = 0
+        state['retry_after'] = None
+
+    def _log_limits(self, spider):
+        slots = self.crawler.engine.downloader.slots if self.crawler.engine else {}
+        for key in self.samples:
+            slot = slots.get(key)
+            if slot is not None:
+                spider.logger.info(f"adaptive throttle {key}: concurrency {slot.concurrency}, delay {slot.delay:.2f}s")
+
+# downloads made outside scrapy (the minio pipeline fetches files and attachments with requests on its own threads)
+# are held to the limits of the downloader slot of the same host: at most slot.concurrency of them at a time and
+# slot.delay apart, counted from the slot's last download too. slot.lastseen is moved forward so scrapy's own
+# requests keep their distance from ours. their responses don't feed the throttle back, only its limits apply
+class SlotGate:
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.condition = threading.Condition()
+        # host -> pipeline downloads in flight, and when the last one started
+        self.active = {}
+        self.last_start = {}
+
+    def _slot(self, host):
+        engine = self.crawler.engine
+        if engine is None or engine.downloader is None:
+            return None
+        return engine.downloader.slots.get(host)
+
+    @contextmanager
+    def hold(self, url):
+        host = urlparse(url).hostname
+        # no slot means scrapy never downloaded from this host, there's no limit to follow
+        if self._slot(host) is None:
+            yield
+            return
+
+        with self.condition:
+            while True:
+                slot = self._slot(host)
+                if slot is None:
+                    break
+                wait = max(self.last_start.get(host, 0), slot.lastseen) + slot.delay - time.time()
+                if self.active.get(host, 0) < max(1, slot.concurrency) and wait <= 0:
+                    slot.lastseen = time.time()
+                    break
+                # woken up when a download ends, the limits may also change meanwhile so check again soon
+                self.condition.wait(min(wait, 1.0) if wait > 0 else 1.0)
+            self.active[host] = self.active.get(host, 0) + 1
+            self.last_start[host] = time.time()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active[host] -= 1
+                self.condition.notify_all()
@@ -0,0 +1,95 @@
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from src.utils.clients import s3_client
+from src.utils.http_cache import build_cache_store
+
+# revisits always go back to the site with If-None-Match / If-Modified-Since, a 304 is served from the cache.
+# decision pages hardly ever change but we still want to know when they do, so nothing is treated as fresh
+class RevalidatePolicy(RFC2616Policy):
+    def should_cache_request(self, request):
+        # search results are POSTs (and new cases show up in them), only plain pages are cached
+        return request.method == 'GET' and super().should_cache_request(request)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+# HTTPCACHE_STORAGE backed by src/utils/http_cache.py so the minio pipeline sees the same entries.
+# entries are keyed by url (only GETs are cached) instead of the request fingerprint.
+# scrapy calls the storage on the reactor thread: the disk backend keeps pages (entry and body) locally, the minio
+# backend (opt-in, shared between workers) only reads the validators the pipeline recorded for the page and the
+# page it stored under files/, and writes nothing here
+class SharedCacheStorage:
+    namespace = 'pages'
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.store = None
+
+    def open_spider(self, spider):
+        client = None
+        if self.settings.get('HTTPCACHE_BACKEND') == 'minio':
+            client = s3_client(
+                self.settings.get('MINIO_ENDPOINT'),
+                self.settings.get('MINIO_ACCESS_KEY'),
+                self.settings.get('MINIO_SECRET_KEY')
+            )
+        self.store = build_cache_store(
+            self.settings.get('HTTPCACHE_BACKEND'),
+            self.settings.get('HTTPCACHE_DIR'),
+            self.settings.get('HTTPCACHE_PREFIX'),
+            client,
+            self.settings.get('MINIO_BUCKET')
+        )
+        spider.logger.info(f"http cache: {self.settings.get('HTTPCACHE_BACKEND')} backend")
+
+    def close_spider(self, spider):
+        pass
+
+    def retrieve_response(self, spider, request):
+        if not self.store.keeps_bodies:
+            return self._retrieve_stored_page(request)
+        entry, body = self.store.get(self.namespace, request.url, with_body=True)
+        if entry is None or body is None:
+            return None
+        headers = Headers(entry['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=entry['url'], body=body)
+        return respcls(url=entry['url'], headers=headers, status=entry['status'], body=body)
+
+    def _retrieve_stored_page(self, request):
+        # the pipeline's entry for the page (written once it stored it): validators, content type and key
+        entry, body = self.store.get('files', request.url, with_body=True)
+        if entry is None or body is None:
+            return None
+        headers = Headers({
+            name: value for name, value in [
+                ('Content-Type', entry.get('content_type')),
+                ('ETag', entry.get('etag')),
+                ('Last-Modified', entry.get('last_modified')),
+            ] if value
+        })
+        respcls = responsetypes.from_args(headers=headers, url=entry['url'], body=body)
+        return respcls(url=entry['url'], headers=headers, status=200, body=body)
+
+    def store_response(self, spider, request, response):
+        if not self.store.keeps_bodies:
+            # the minio pipeline records the page's validators once the page is stored under files/
+            return
+        headers = {
+            key.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for key, values in response.headers.items()
+        }
+        entry = {
+            'url': response.url,
+            'status': response.status,
+            'headers': headers,
+            'etag': response.headers.get('ETag', b'').decode('latin-1') or None,
+            'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1') or None,
+        }
+        # after a 304 only the headers were freshened, the body we have is still the right one
+        body = None if 'cached' in response.flags else response.body
+        try:
+            self.store.put(self.namespace, request.url, entry, body)
+        except Exception as e:
+            spider.logger.warning(f"failed to cache {request.url}: {e}")
@@ -1,8 +1,12 @@
 import scrapy
 
+# fields only used to hand data between the spider and the pipelines, never persisted
+TRANSIENT_FIELDS = ('page_body', 'page_headers', 'skip_files')
+
 class Case(scrapy.Item):
     ref_number = scrapy.Field()
     published_date = scrapy.Field()
+    published_at = scrapy.Field()
     description = scrapy.Field()
     url = scrapy.Field()
     partition_date = scrapy.Field()
@@ -11,3 +15,8 @@ class Case(scrapy.Item):
     scraped_at = scrapy.Field()
     additional_files = scrapy.Field()
     body_filters = scrapy.Field()
+    # the decision page as fetched by the spider, so the pipeline doesn't download it again
+    page_body = scrapy.Field()
+    page_headers = scrapy.Field()
+    # set on items that only merge body_filters into an existing record (incremental mode)
+    skip_files = scrapy.Field()
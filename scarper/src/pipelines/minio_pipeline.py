@@ -1,17 +1,53 @@
-import boto3
 import requests
-import io
+import json
 import os
 import hashlib
-from botocore.client import Config
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+from src.middlewares.adaptive_throttle import SlotGate
+from src.utils.blobs import REF_SUFFIX, AttachmentUrlCache, blob_key, ref_body, staging_key
+from src.utils.clients import checked_buckets, mongo_client, s3_client
+from src.utils.codec import Compressor, check_codec, codec_for, storage_args
+from src.utils.http_cache import build_cache_store, conditional_headers, header_value
 
 class MinioPipeline:
-    def __init__(self, endpoint, access_key, secret_key, bucket_name):
+    def __init__(self, endpoint, access_key, secret_key, bucket_name, upload_concurrency=4, part_size=8 * 1024 * 1024,
+                 http_cache_backend=None, http_cache_dir='.httpcache', http_cache_prefix='http-cache/', storage_codec='none',
+                 dedupe_attachments=False, blob_prefix='blobs/', mongo_uri=None, mongo_db=None):
         self.endpoint = endpoint
         self.access_key = access_key
         self.secret_key = secret_key
         self.bucket_name = bucket_name
+        self.upload_concurrency = upload_concurrency
+        # s3 needs at least 5MiB for every multipart part except the last one
+        self.part_size = max(part_size, 5 * 1024 * 1024)
         self.s3_client = None
+        self.thread_pool = None
+        # keys already in the bucket, built once per crawl so we don't head_object every item
+        self.existing_keys = set()
+        self.indexed_prefixes = set()
+        # partition -> ref_number -> {key: object info}, written to manifests/{partition}.json on close
+        # so the transformer doesn't have to list every case folder
+        self.manifests = {}
+        # shared http cache (see src/utils/http_cache.py), files keep their validators and where they were stored
+        self.http_cache_backend = http_cache_backend
+        self.http_cache_dir = http_cache_dir
+        self.http_cache_prefix = http_cache_prefix
+        self.http_cache = None
+        # text objects are compressed with this codec (see src/utils/codec.py)
+        self.storage_codec = check_codec(storage_codec or 'none')
+        # attachments stored once by content (see src/utils/blobs.py), the url cache lives in mongo
+        self.dedupe_attachments = dedupe_attachments
+        self.blob_prefix = blob_prefix
+        self.mongo_uri = mongo_uri
+        self.mongo_db = mongo_db
+        self.attachment_urls = None
+        self.existing_blobs = set()
+        # url -> blob of the attachments already revalidated in this crawl
+        self.revalidated = {}
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -19,35 +55,136 @@ class MinioPipeline:
             endpoint=crawler.settings.get('MINIO_ENDPOINT', 'http://localhost:9000'),
             access_key=crawler.settings.get('MINIO_ACCESS_KEY', 'minioadmin'),
             secret_key=crawler.settings.get('MINIO_SECRET_KEY', 'minioadmin'),
-            bucket_name=crawler.settings.get('MINIO_BUCKET', 'wrc-decisions')
+            bucket_name=crawler.settings.get('MINIO_BUCKET', 'wrc-decisions'),
+            upload_concurrency=crawler.settings.getint('MINIO_UPLOAD_CONCURRENCY', 4),
+            part_size=crawler.settings.getint('MINIO_PART_SIZE', 8 * 1024 * 1024),
+            http_cache_backend=crawler.settings.get('HTTPCACHE_BACKEND') if crawler.settings.getbool('HTTPCACHE_ENABLED') else None,
+            http_cache_dir=crawler.settings.get('HTTPCACHE_DIR', '.httpcache'),
+            http_cache_prefix=crawler.settings.get('HTTPCACHE_PREFIX', 'http-cache/'),
+            storage_codec=crawler.settings.get('STORAGE_CODEC', 'none'),
+            dedupe_attachments=crawler.settings.getbool('ATTACHMENT_DEDUPE'),
+            blob_prefix=crawler.settings.get('BLOB_PREFIX', 'blobs/'),
+            mongo_uri=crawler.settings.get('MONGO_URI'),
+            mongo_db=crawler.settings.get('MONGO_DATABASE')
         )
 
     def open_spider(self, spider):
-        self.s3_client = boto3.client('s3',
-                                      endpoint_url=self.endpoint,
-                                      aws_access_key_id=self.access_key,
-                                      aws_secret_access_key=self.secret_key,
-                                      config=Config(signature_version='s3v4'),
-                                      region_name='us-east-1') 
+        self.s3_client = s3_client(self.endpoint, self.access_key, self.secret_key, max(10, self.upload_concurrency))
         
-        try:
-            self.s3_client.head_bucket(Bucket=self.bucket_name)
-        except:
-            spider.logger.info(f"bucket {self.bucket_name} not found, creating...")
+        if self.bucket_name not in checked_buckets:
+            try:
+                self.s3_client.head_bucket(Bucket=self.bucket_name)
+                checked_buckets.add(self.bucket_name)
+            except:
+                spider.logger.info(f"bucket {self.bucket_name} not found, creating...")
+                try:
+                    # NOTE: only added this for the ease of use, in reality buckets should be managed outside of the application
+                    self.s3_client.create_bucket(Bucket=self.bucket_name)
+                    checked_buckets.add(self.bucket_name)
+                except Exception as e:
+                     spider.logger.error(f"failed to create bucket: {e}")
+
+        self._build_existence_index(spider)
+        if self.dedupe_attachments:
+            self.attachment_urls = AttachmentUrlCache(mongo_client(self.mongo_uri), self.mongo_db)
+        self.http_cache = build_cache_store(self.http_cache_backend, self.http_cache_dir, self.http_cache_prefix, self.s3_client, self.bucket_name)
+
+        # transfers run on their own pool so they never block the reactor and never starve
+        # the reactor's default pool (scrapy uses that one for dns resolution)
+        self.thread_pool = ThreadPool(minthreads=1, maxthreads=self.upload_concurrency, name='minio-transfers')
+        self.thread_pool.start()
+        # files and attachments come from the site too, they follow the adaptive throttle's limits for it
+        self.site_gate = SlotGate(spider.crawler)
+
+    def _build_existence_index(self, spider):
+        # only list the partitions this spider is going to crawl, falls back to the whole files/ prefix
+        ranges = getattr(spider, 'ranges', None)
+        if ranges:
+            prefixes = sorted({f"files/{r_start.strftime('%m-%Y')}/" for r_start, _ in ranges})
+        else:
+            prefixes = ['files/']
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for prefix in prefixes:
             try:
-                # NOTE: only added this for the ease of use, in reality buckets should be managed outside of the application
-                self.s3_client.create_bucket(Bucket=self.bucket_name)
+                for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                    for obj in page.get('Contents', []):
+                        self.existing_keys.add(obj['Key'])
+                        self._add_to_manifest(obj['Key'], obj['Size'], obj['ETag'], None)
+                self.indexed_prefixes.add(prefix)
             except Exception as e:
-                 spider.logger.error(f"failed to create bucket: {e}")
+                spider.logger.warning(f"failed to list {prefix}, falling back to head_object for it: {e}")
+
+        spider.logger.info(f"existence index built with {len(self.existing_keys)} keys from {len(self.indexed_prefixes)} prefixes")
+
+    def _is_indexed(self, key):
+        return any(key.startswith(prefix) for prefix in self.indexed_prefixes)
+
+    def _add_to_manifest(self, key, size, etag, content_type, raw_size=None):
+        # keys look like files/{partition}/{published}/{ref_number}/{file}. size is the object's size in the bucket
+        # (compressed when STORAGE_CODEC is on, same as a listing reports), raw_size the content's when we know it
+        parts = key.split('/')
+        if len(parts) != 5 or parts[0] != 'files':
+            return
+        partition, ref_number = parts[1], parts[3]
+        entry = {
+            'key': key,
+            'size': size,
+            'etag': etag.strip('"') if etag else None,
+            'content_type': content_type,
+        }
+        if raw_size is not None:
+            entry['raw_size'] = raw_size
+        self.manifests.setdefault(partition, {}).setdefault(ref_number, {})[key] = entry
+
+    def _write_manifests(self, spider):
+        for partition, cases in self.manifests.items():
+            manifest_key = f"manifests/{partition}.json"
+            # other spiders in the same run write the same partitions, merge with whatever is there
+            try:
+                existing = json.loads(self.s3_client.get_object(Bucket=self.bucket_name, Key=manifest_key)['Body'].read())
+            except Exception:
+                existing = {'cases': {}}
+
+            merged = existing.get('cases', {})
+            for ref_number, objects in cases.items():
+                entries = {entry['key']: entry for entry in merged.get(ref_number, [])}
+                entries.update(objects)
+                merged[ref_number] = sorted(entries.values(), key=lambda entry: entry['key'])
+
+            manifest = {
+                'partition': partition,
+                'generated_at': datetime.utcnow().isoformat(),
+                'cases': merged,
+            }
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=manifest_key,
+                    Body=json.dumps(manifest).encode('utf-8'),
+                    ContentType='application/json'
+                )
+                spider.logger.info(f"wrote manifest {manifest_key} with {len(merged)} cases")
+            except Exception as e:
+                spider.logger.error(f"failed to write manifest {manifest_key}: {e}")
+
+    def close_spider(self, spider):
+        if self.thread_pool:
+            self.thread_pool.stop()
+        self._write_manifests(spider)
 
+    @defer.inlineCallbacks
     def process_item(self, item, spider):
         url = item.get('url')
         ref_number = item.get('ref_number')
         partition_date = item.get('partition_date', 'unknown').replace('/', '-')
         published_date = item.get('published_date', 'unknown').replace('/', '-')
         additional_files = item.get('additional_files', [])
+        # the spider already fetched the decision page, these never go further than this pipeline
+        page_body = item.pop('page_body', None)
+        page_headers = item.pop('page_headers', None) or {}
         
-        if not url:
+        if not url or item.pop('skip_files', False):
             return item
 
         folder_prefix = f"files/{partition_date}/{published_date}/{ref_number}/"
@@ -60,52 +197,348 @@ class MinioPipeline:
             
             main_filename = f"{folder_prefix}{ref_number}{ext}"
             
-            try:
-                self.s3_client.head_object(Bucket=self.bucket_name, Key=main_filename)
+            if self._is_indexed(main_filename):
+                exists = main_filename in self.existing_keys
+            else:
+                exists = yield self._run_in_pool(self._object_exists, main_filename)
+            if exists:
                 spider.logger.info(f"file {main_filename} already exists. skipping download.")
                 item['file_path'] = f"s3://{self.bucket_name}/{folder_prefix}"
                 return item # skip attachment processing as well? Yes per requirement ("don't create a new record or upload a new file")
-            except:
-                pass
 
-            self._download_and_upload(url, main_filename, spider, item, is_main=True)
-            
+            # main file and attachments are transferred concurrently, the pool size caps how many run at once
+            if page_body is not None:
+                content_type = page_headers.get('Content-Type', 'application/octet-stream')
+                main_transfer = self._run_in_pool(self._store_page, url, page_body, page_headers, content_type, main_filename, spider)
+            else:
+                main_transfer = self._run_in_pool(self._download_and_upload, url, main_filename, spider)
+
+            transfers = [main_transfer]
+            keys = [main_filename]
             for file_url in additional_files:
                 fname = os.path.basename(file_url)
                 if not fname:
                     fname = f"attachment_{hashlib.md5(file_url.encode()).hexdigest()}"
                 
-                file_key = f"{folder_prefix}{fname}"
-                self._download_and_upload(file_url, file_key, spider, item, is_main=False)
-                
+                if self.dedupe_attachments:
+                    # the case folder only gets a reference to the shared blob
+                    file_key = f"{folder_prefix}{fname}{REF_SUFFIX}"
+                    transfers.append(self._run_in_pool(self._store_attachment, file_url, fname, file_key, spider))
+                else:
+                    file_key = f"{folder_prefix}{fname}"
+                    transfers.append(self._run_in_pool(self._download_and_upload, file_url, file_key, spider))
+                keys.append(file_key)
+
+            results = yield defer.DeferredList(transfers, consumeErrors=True)
+
+            success, uploaded = results[0]
+            if success and uploaded:
+                item['file_hash'] = uploaded['sha256']
                 item['file_path'] = f"s3://{self.bucket_name}/{folder_prefix}"
+                # only the main file decides if a case is skipped, attachments are tracked to keep the index honest
+                for key, (ok, uploaded) in zip(keys, results):
+                    if ok and uploaded:
+                        self.existing_keys.add(key)
+                        self._add_to_manifest(key, uploaded.get('stored_size'), uploaded['etag'], uploaded['content_type'], uploaded['size'])
             
         except Exception as e:
             spider.logger.error(f"error processing files for {ref_number}: {e}")
             
         return item
 
-    def _download_and_upload(self, url, filename, spider, item, is_main=False):
+    def _run_in_pool(self, func, *args, **kwargs):
+        return threads.deferToThreadPool(reactor, self.thread_pool, func, *args, **kwargs)
+
+    def _object_exists(self, key):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except:
+            return False
+
+    def _store_page(self, url, content, headers, content_type, filename, spider):
+        # the spider revalidated the page already, if it's the same content we stored before it's copied, not uploaded
+        entry = self._cached_file(url)
+        if entry and entry.get('sha256') == hashlib.sha256(content).hexdigest():
+            reused = self._reuse_cached(entry, filename, spider)
+            if reused:
+                return reused
+        uploaded = self._upload(content, content_type, filename, spider)
+        self._remember_file(url, headers, filename, uploaded, spider)
+        return uploaded
+
+    def _download_and_upload(self, url, filename, spider, revalidate=True):
+        # runs inside the transfer pool, returns what was uploaded (None if it failed).
+        # the body is streamed straight into the upload so large attachments never sit in memory whole
+        entry = self._cached_file(url) if revalidate else None
         try:
             spider.logger.debug(f"downloading {url}")
-            response = requests.get(url, verify=False, timeout=30)
-            
-            if response.status_code == 200:
-                data = io.BytesIO(response.content)
+            with self._site_get(url, conditional_headers(entry)) as response:
+                if response.status_code == 304 and entry:
+                    # unchanged since we stored it, only the headers came over the wire
+                    reused = self._reuse_cached(entry, filename, spider)
+                    if reused:
+                        return reused
+                elif response.status_code == 200:
+                    content_type = response.headers.get('Content-Type', 'application/octet-stream')
+                    chunks = response.iter_content(chunk_size=1024 * 1024)
+                    uploaded = self._upload_stream(chunks, content_type, filename, spider)
+                    self._remember_file(url, response.headers, filename, uploaded, spider)
+                    return uploaded
+                else:
+                    spider.logger.warning(f"failed to download {url}: status {response.status_code}")
+                    return None
+        except Exception as e:
+            spider.logger.error(f"failed to download {url}: {e}")
+            return None
+        # a 304 for a copy we can't reuse anymore, fetched again without validators once the gate is released
+        return self._download_and_upload(url, filename, spider, revalidate=False)
+
+    @contextmanager
+    def _site_get(self, url, headers):
+        with self.site_gate.hold(url):
+            with requests.get(url, headers=headers, verify=False, timeout=30, stream=True) as response:
+                yield response
+
+    def _store_attachment(self, url, name, ref_key, spider):
+        # runs inside the transfer pool. a url stored before (by any case or run) is revalidated with its
+        # validators, a 304 keeps the blob. new content is staged, hashed and moved to its blob key unless that
+        # blob exists already. a url is revalidated once per crawl, the other cases linking it reuse the answer
+        blob = self.revalidated.get(url)
+        if blob is None:
+            known = self._known_blob(url, spider)
+            blob = self._fetch_blob(url, known, spider)
+            if blob is None:
+                return None
+            if blob is not known:
+                try:
+                    self.attachment_urls.put(url, blob)
+                except Exception as e:
+                    spider.logger.warning(f"failed to remember blob of {url}: {e}")
+            self.revalidated[url] = blob
+
+        body = ref_body(url, name, blob['sha256'], self.bucket_name, blob['key'], blob['size'], blob['content_type'])
+        try:
+            response = self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=ref_key,
+                Body=body,
+                ContentType='application/json',
+                Metadata={'blob-sha256': blob['sha256']}
+            )
+        except Exception as e:
+            spider.logger.error(f"failed to write reference {ref_key}: {e}")
+            return None
+        return {
+            'sha256': blob['sha256'],
+            'etag': response.get('ETag'),
+            'size': len(body),
+            'stored_size': len(body),
+            'content_type': 'application/json',
+        }
+
+    def _known_blob(self, url, spider):
+        try:
+            blob = self.attachment_urls.get(url)
+        except Exception as e:
+            spider.logger.warning(f"failed to look up {url} in the attachment cache: {e}")
+            return None
+        if blob is None:
+            return None
+        if blob['key'] in self.existing_blobs or self._object_exists(blob['key']):
+            self.existing_blobs.add(blob['key'])
+            return blob
+        # the blob was removed from the bucket, download it again
+        return None
+
+    def _fetch_blob(self, url, known, spider):
+        # returns known itself when the site says it didn't change, otherwise the newly stored blob
+        staged = staging_key(self.blob_prefix, uuid.uuid4().hex)
+        try:
+            spider.logger.debug(f"downloading {url}")
+            with self._site_get(url, conditional_headers(known)) as response:
+                if response.status_code == 304 and known:
+                    spider.logger.debug(f"{url} unchanged, still {known['key']}")
+                    return known
+                if response.status_code != 200:
+                    spider.logger.warning(f"failed to download {url}: status {response.status_code}")
+                    return None
                 content_type = response.headers.get('Content-Type', 'application/octet-stream')
-                
-                if is_main:
-                    file_hash = hashlib.sha256(response.content).hexdigest()
-                    item['file_hash'] = file_hash
-
-                self.s3_client.upload_fileobj(
-                    data,
-                    self.bucket_name,
-                    filename,
-                    ExtraArgs={'ContentType': content_type}
+                validators = {
+                    'etag': header_value(response.headers, 'ETag'),
+                    'last_modified': header_value(response.headers, 'Last-Modified'),
+                }
+                uploaded = self._upload_stream(response.iter_content(chunk_size=1024 * 1024), content_type, staged, spider)
+        except Exception as e:
+            spider.logger.error(f"failed to download {url}: {e}")
+            return None
+        if not uploaded:
+            return None
+
+        key = blob_key(self.blob_prefix, uploaded['sha256'])
+        try:
+            if key not in self.existing_blobs and not self._object_exists(key):
+                # server side copy keeps the content type and encoding, the same content from another url skips it
+                self.s3_client.copy_object(Bucket=self.bucket_name, Key=key, CopySource={'Bucket': self.bucket_name, 'Key': staged})
+                spider.logger.debug(f"stored {url} as {key}")
+            self.existing_blobs.add(key)
+        except Exception as e:
+            spider.logger.error(f"failed to store blob {key} for {url}: {e}")
+            return None
+        finally:
+            try:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=staged)
+            except Exception:
+                pass
+        return {
+            'sha256': uploaded['sha256'],
+            'key': key,
+            'size': uploaded['size'],
+            'content_type': uploaded['content_type'],
+            **validators,
+        }
+
+    def _cached_file(self, url):
+        if self.http_cache is None:
+            return None
+        entry, _ = self.http_cache.get('files', url)
+        return entry
+
+    def _remember_file(self, url, headers, filename, uploaded, spider):
+        if self.http_cache is None or not uploaded:
+            return
+        entry = {
+            'url': url,
+            'etag': header_value(headers, 'ETag'),
+            'last_modified': header_value(headers, 'Last-Modified'),
+            'key': filename,
+            'sha256': uploaded['sha256'],
+            'size': uploaded['size'],
+            'stored_size': uploaded.get('stored_size'),
+            'content_type': uploaded['content_type'],
+        }
+        try:
+            self.http_cache.put('files', url, entry)
+        except Exception as e:
+            spider.logger.warning(f"failed to cache {url}: {e}")
+
+    def _reuse_cached(self, entry, filename, spider):
+        # the content is already in the bucket under entry['key'], nothing to upload if that's where it goes,
+        # otherwise a server side copy. None when the stored object is gone
+        reused = {
+            'sha256': entry['sha256'],
+            'size': entry['size'],
+            # a copy is byte for byte, entries cached before stored_size was kept don't know it
+            'stored_size': entry.get('stored_size'),
+            'content_type': entry['content_type'],
+        }
+        try:
+            if entry['key'] == filename:
+                response = self.s3_client.head_object(Bucket=self.bucket_name, Key=filename)
+                reused['stored_size'] = response.get('ContentLength', reused['stored_size'])
+                spider.logger.debug(f"{filename} unchanged, already stored")
+            else:
+                response = self.s3_client.copy_object(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    CopySource={'Bucket': self.bucket_name, 'Key': entry['key']}
+                )['CopyObjectResult']
+                spider.logger.debug(f"{filename} unchanged, copied from {entry['key']}")
+        except Exception as e:
+            spider.logger.debug(f"cached copy of {filename} unusable: {e}")
+            return None
+        return {**reused, 'etag': response.get('ETag')}
+
+    def _upload(self, content, content_type, filename, spider):
+        return self._upload_stream([content], content_type, filename, spider)
+
+    def _upload_stream(self, chunks, content_type, filename, spider):
+        # hashes while reading and uploads part by part, at most one part is held in memory.
+        # files that fit in the first part are sent with a single put_object. the hash and size are of the
+        # content as downloaded, text is compressed on the way when STORAGE_CODEC is set
+        codec = codec_for(self.storage_codec, content_type)
+        compressor = Compressor(codec)
+        extra_args = storage_args(codec)
+        hasher = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+
+        def send_full_parts():
+            nonlocal upload_id
+            while len(buffer) >= self.part_size:
+                if upload_id is None:
+                    upload_id = self.s3_client.create_multipart_upload(
+                        Bucket=self.bucket_name,
+                        Key=filename,
+                        ContentType=content_type,
+                        **extra_args
+                    )['UploadId']
+                part_number = len(parts) + 1
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=bytes(buffer[:self.part_size])
+                )
+                parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+                del buffer[:self.part_size]
+
+        try:
+            for chunk in chunks:
+                hasher.update(chunk)
+                size += len(chunk)
+                buffer.extend(compressor.compress(chunk))
+                send_full_parts()
+            buffer.extend(compressor.flush())
+            send_full_parts()
+
+            if upload_id is None:
+                stored_size = len(buffer)
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    Body=bytes(buffer),
+                    ContentType=content_type,
+                    **extra_args
                 )
-                spider.logger.debug(f"uploaded to s3://{self.bucket_name}/{filename}")
             else:
-                spider.logger.warning(f"failed to download {url}: status {response.status_code}")
+                stored_size = len(parts) * self.part_size + len(buffer)
+                if buffer:
+                    part_number = len(parts) + 1
+                    part = self.s3_client.upload_part(
+                        Bucket=self.bucket_name,
+                        Key=filename,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                        Body=bytes(buffer)
+                    )
+                    parts.append({'PartNumber': part_number, 'ETag': part['ETag']})
+                response = self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=filename,
+                    UploadId=upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+
+            if codec:
+                spider.logger.debug(f"uploaded to s3://{self.bucket_name}/{filename} ({codec}, {size} -> {stored_size} bytes)")
+            else:
+                spider.logger.debug(f"uploaded to s3://{self.bucket_name}/{filename}")
+            return {
+                'sha256': hasher.hexdigest(),
+                'etag': response.get('ETag'),
+                'size': size,
+                'stored_size': stored_size,
+                'content_type': content_type,
+            }
         except Exception as e:
-            spider.logger.error(f"failed to upload {url}: {e}")
+            spider.logger.error(f"failed to upload {filename}: {e}")
+            if upload_id is not None:
+                try:
+                    self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=filename, UploadId=upload_id)
+                except Exception:
+                    pass
+        return None
@@ -0,0 +1,142 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import argparse
+import json
+import logging
+import uuid
+from datetime import datetime
+from scrapy.settings.default_settings import TWISTED_REACTOR
+from scrapy.utils.reactor import install_reactor
+
+# the reactor a CrawlerProcess would install, it has to be in place before twisted.internet.reactor is imported
+install_reactor(TWISTED_REACTOR)
+
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from twisted.internet import defer, reactor
+from twisted.web import resource, server
+from src.main import start_crawls
+from src.settings import Settings, get_settings
+from src.utils.clients import checked_buckets, mongo_client, s3_client
+
+IMPORTS_DONE_AT = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# resident scraper: imports, the reactor and the mongo/minio clients are set up once and every job submitted over
+# http is crawled on the same CrawlerRunner. jobs take the same arguments as the cli (see src/main.py)
+class ScraperService:
+    def __init__(self, settings):
+        self.runner = CrawlerRunner(settings)
+        self.jobs = {}
+        self.startup = {}
+
+    def warm_up(self):
+        # connects the shared clients now instead of on the first crawl
+        started = time.perf_counter()
+        mongo_client(Settings.MONGO_URI).admin.command('ping')
+        client = s3_client(Settings.MINIO_ENDPOINT, Settings.MINIO_ACCESS_KEY, Settings.MINIO_SECRET_KEY, max(10, Settings.MINIO_UPLOAD_CONCURRENCY))
+        try:
+            client.head_bucket(Bucket=Settings.MINIO_BUCKET)
+            checked_buckets.add(Settings.MINIO_BUCKET)
+        except Exception as e:
+            logger.warning(f"bucket {Settings.MINIO_BUCKET} not reachable yet, the first crawl will check again: {e}")
+        return time.perf_counter() - started
+
+    def submit(self, params):
+        for field in ('from_date', 'to_date'):
+            datetime.strptime(params.get(field) or '', "%d/%m/%Y")
+        bodies = params.get('bodies')
+        if isinstance(bodies, str):
+            bodies = [b.strip() for b in bodies.split(',') if b.strip()]
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'params': params,
+            'status': 'running',
+            'submitted_at': datetime.utcnow().isoformat(),
+        }
+        self.jobs[job['id']] = job
+        started = time.perf_counter()
+        crawls = start_crawls(
+            self.runner, q=params.get('q', ''), from_date=params['from_date'], to_date=params['to_date'], bodies=bodies,
+            single_pass=bool(params.get('single_pass')), incremental=bool(params.get('incremental')),
+            adaptive=bool(params.get('adaptive')), resume=bool(params.get('resume'))
+        )
+        logger.info(f"job {job['id']} started: {params}")
+        defer.DeferredList(crawls, consumeErrors=True).addCallback(self._finished, job, started)
+        return job
+
+    def _finished(self, results, job, started):
+        errors = [str(failure.value) for ok, failure in results if not ok]
+        job['status'] = 'failed' if errors else 'done'
+        job['error'] = '; '.join(errors) or None
+        job['finished_at'] = datetime.utcnow().isoformat()
+        job['duration'] = round(time.perf_counter() - started, 3)
+        logger.info(f"job {job['id']} {job['status']} in {job['duration']}s")
+
+    def health(self):
+        statuses = [job['status'] for job in self.jobs.values()]
+        return {
+            'status': 'ok',
+            'uptime': round(time.perf_counter() - STARTED_AT, 3),
+            'startup': self.startup,
+            'jobs': {status: statuses.count(status) for status in set(statuses)},
+        }
+
+class ServiceResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def render_GET(self, request):
+        path = request.path.decode().strip('/').split('/')
+        if path == ['health']:
+            return self._json(request, 200, self.service.health())
+        if len(path) == 2 and path[0] == 'jobs' and path[1] in self.service.jobs:
+            return self._json(request, 200, self.service.jobs[path[1]])
+        return self._json(request, 404, {'error': 'not found'})
+
+    def render_POST(self, request):
+        if request.path.decode().strip('/') != 'jobs':
+            return self._json(request, 404, {'error': 'not found'})
+        try:
+            params = json.loads(request.content.read() or b'{}')
+            job = self.service.submit(params)
+        except (ValueError, TypeError) as e:
+            return self._json(request, 400, {'error': f"invalid job: {e}"})
+        return self._json(request, 202, job)
+
+    def _json(self, request, status, payload):
+        request.setResponseCode(status)
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(payload).encode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description='resident wrc scraper service')
+    parser.add_argument('--port', type=int, default=Settings.SERVICE_PORT, help='http port to accept jobs on')
+    parser.add_argument('--debug', action='store_true', help='enable debug logging')
+    args = parser.parse_args()
+
+    settings = get_settings(debug=args.debug)
+    configure_logging(settings)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    service = ScraperService(settings)
+    clients_time = service.warm_up()
+    reactor.listenTCP(args.port, server.Site(ServiceResource(service)))
+
+    # one-off costs a cli run pays every time, for comparing with the client's `measure`
+    service.startup = {
+        'imports': round(IMPORTS_DONE_AT - STARTED_AT, 3),
+        'clients': round(clients_time, 3),
+        'total': round(time.perf_counter() - STARTED_AT, 3),
+    }
+    logger.info(f"scraper service listening on {args.port}, startup took {service.startup}")
+    reactor.run()
+
+if __name__ == '__main__':
+    main()
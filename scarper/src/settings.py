@@ -7,12 +7,57 @@ class Settings:
     # mongo
     MONGO_URI = os.getenv('MONGO_URI')
     MONGO_DATABASE = os.getenv('MONGO_DATABASE')
+    # upserts are sent in bulk once the batch is full or the interval (seconds) passes
+    MONGO_BATCH_SIZE = int(os.getenv('MONGO_BATCH_SIZE', '100'))
+    MONGO_FLUSH_INTERVAL = float(os.getenv('MONGO_FLUSH_INTERVAL', '5'))
     
     # minio
     MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT')
     MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY')
     MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY')
     MINIO_BUCKET = os.getenv('MINIO_BUCKET')
+    # max number of files downloaded/uploaded at the same time (per spider)
+    MINIO_UPLOAD_CONCURRENCY = int(os.getenv('MINIO_UPLOAD_CONCURRENCY', '4'))
+    # files are streamed to minio in parts of this size (bytes), also the most a transfer keeps in memory
+    MINIO_PART_SIZE = int(os.getenv('MINIO_PART_SIZE', str(8 * 1024 * 1024)))
+    # compression of stored html/text objects: none, gzip or zstd (needs the zstandard package), see src/utils/codec.py
+    STORAGE_CODEC = os.getenv('STORAGE_CODEC', 'none')
+    # opt-in: attachments are stored once under BLOB_PREFIX by their sha256 and referenced from the case folders
+    # (src/utils/blobs.py). changes the bucket layout the transformer reads, off keeps one copy per case folder
+    ATTACHMENT_DEDUPE = os.getenv('ATTACHMENT_DEDUPE', 'false').lower() == 'true'
+    BLOB_PREFIX = os.getenv('BLOB_PREFIX', 'blobs/')
+
+    # adaptive partitioning: partitions searched together at first, and the most pages a search may have before it's split
+    ADAPTIVE_MERGE_MONTHS = int(os.getenv('ADAPTIVE_MERGE_MONTHS', '3'))
+    ADAPTIVE_MAX_PAGES = int(os.getenv('ADAPTIVE_MAX_PAGES', '10'))
+
+    # download limits, retries and the adaptive throttle (see src/middlewares/adaptive_throttle.py)
+    CONCURRENT_REQUESTS = int(os.getenv('CONCURRENT_REQUESTS', '32'))
+    DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', '30'))
+    RETRY_TIMES = int(os.getenv('RETRY_TIMES', '3'))
+    ADAPTIVE_THROTTLE_ENABLED = os.getenv('ADAPTIVE_THROTTLE_ENABLED', 'true').lower() == 'true'
+    ADAPTIVE_THROTTLE_TARGET_LATENCY = float(os.getenv('ADAPTIVE_THROTTLE_TARGET_LATENCY', '2.0'))
+    ADAPTIVE_THROTTLE_START_CONCURRENCY = int(os.getenv('ADAPTIVE_THROTTLE_START_CONCURRENCY', '4'))
+    ADAPTIVE_THROTTLE_MIN_CONCURRENCY = int(os.getenv('ADAPTIVE_THROTTLE_MIN_CONCURRENCY', '1'))
+    ADAPTIVE_THROTTLE_MAX_CONCURRENCY = int(os.getenv('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', '16'))
+    ADAPTIVE_THROTTLE_MAX_DELAY = float(os.getenv('ADAPTIVE_THROTTLE_MAX_DELAY', '30'))
+
+    # http cache for decision pages and files, revisits are revalidated with If-None-Match/If-Modified-Since.
+    # disk uses HTTP_CACHE_DIR (the user cache dir by default, not the source tree which docker bind mounts). minio (opt-in, shared by every worker) keeps the validators in MINIO_BUCKET under
+    # HTTP_CACHE_PREFIX and serves bodies from files/, its reads block the reactor so it costs latency per page
+    HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+    HTTP_CACHE_BACKEND = os.getenv('HTTP_CACHE_BACKEND', 'disk')
+    HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'wrc-scraper', 'httpcache'))
+    HTTP_CACHE_PREFIX = os.getenv('HTTP_CACHE_PREFIX', 'http-cache/')
+
+    # crawl checkpoints in mongo (crawl_state collection), written every CRAWL_STATE_FLUSH_INTERVAL seconds, used by --resume
+    CRAWL_STATE_ENABLED = os.getenv('CRAWL_STATE_ENABLED', 'true').lower() == 'true'
+    CRAWL_STATE_FLUSH_INTERVAL = float(os.getenv('CRAWL_STATE_FLUSH_INTERVAL', '10'))
+    # a decision page that keeps failing (after the retry middleware) is parked after this many tries
+    CRAWL_STATE_MAX_DECISION_ATTEMPTS = int(os.getenv('CRAWL_STATE_MAX_DECISION_ATTEMPTS', '3'))
+
+    # resident service (src/server.py)
+    SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8081'))
 
 def get_settings(debug=False):
     return {
@@ -20,15 +65,50 @@ def get_settings(debug=False):
         'ROBOTSTXT_OBEY': False,
         'USER_AGENT': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
         'COOKIES_ENABLED': True,
+        'CONCURRENT_REQUESTS': Settings.CONCURRENT_REQUESTS,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': Settings.ADAPTIVE_THROTTLE_MAX_CONCURRENCY,
+        'DOWNLOAD_TIMEOUT': Settings.DOWNLOAD_TIMEOUT,
+        'RETRY_ENABLED': True,
+        'RETRY_TIMES': Settings.RETRY_TIMES,
+        'RETRY_HTTP_CODES': [408, 429, 500, 502, 503, 504, 522, 524],
+        # the adaptive throttle replaces autothrottle, both adjusting the same slots would fight each other
+        'AUTOTHROTTLE_ENABLED': False,
+        'DOWNLOADER_MIDDLEWARES': {
+            'src.middlewares.adaptive_throttle.AdaptiveThrottleMiddleware': 990, # closest to the downloader, sees raw responses
+        },
+        'ADAPTIVE_THROTTLE_ENABLED': Settings.ADAPTIVE_THROTTLE_ENABLED,
+        'ADAPTIVE_THROTTLE_TARGET_LATENCY': Settings.ADAPTIVE_THROTTLE_TARGET_LATENCY,
+        'ADAPTIVE_THROTTLE_START_CONCURRENCY': Settings.ADAPTIVE_THROTTLE_START_CONCURRENCY,
+        'ADAPTIVE_THROTTLE_MIN_CONCURRENCY': Settings.ADAPTIVE_THROTTLE_MIN_CONCURRENCY,
+        'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': Settings.ADAPTIVE_THROTTLE_MAX_CONCURRENCY,
+        'ADAPTIVE_THROTTLE_MAX_DELAY': Settings.ADAPTIVE_THROTTLE_MAX_DELAY,
+        'HTTPCACHE_ENABLED': Settings.HTTP_CACHE_ENABLED,
+        'HTTPCACHE_STORAGE': 'src.middlewares.http_cache.SharedCacheStorage',
+        'HTTPCACHE_POLICY': 'src.middlewares.http_cache.RevalidatePolicy',
+        'HTTPCACHE_BACKEND': Settings.HTTP_CACHE_BACKEND,
+        'HTTPCACHE_DIR': Settings.HTTP_CACHE_DIR,
+        'HTTPCACHE_PREFIX': Settings.HTTP_CACHE_PREFIX,
         'ITEM_PIPELINES': {
            'src.pipelines.minio_pipeline.MinioPipeline': 200, # lower number means higher priority
            'src.pipelines.mongo_pipeline.MongoPipeline': 300,
         },
         'MONGO_URI': Settings.MONGO_URI,
         'MONGO_DATABASE': Settings.MONGO_DATABASE,
+        'MONGO_BATCH_SIZE': Settings.MONGO_BATCH_SIZE,
+        'MONGO_FLUSH_INTERVAL': Settings.MONGO_FLUSH_INTERVAL,
         'MINIO_ENDPOINT': Settings.MINIO_ENDPOINT,
         'MINIO_ACCESS_KEY': Settings.MINIO_ACCESS_KEY,
         'MINIO_SECRET_KEY': Settings.MINIO_SECRET_KEY,
         'MINIO_BUCKET': Settings.MINIO_BUCKET,
+        'MINIO_UPLOAD_CONCURRENCY': Settings.MINIO_UPLOAD_CONCURRENCY,
+        'MINIO_PART_SIZE': Settings.MINIO_PART_SIZE,
+        'STORAGE_CODEC': Settings.STORAGE_CODEC,
+        'ATTACHMENT_DEDUPE': Settings.ATTACHMENT_DEDUPE,
+        'BLOB_PREFIX': Settings.BLOB_PREFIX,
+        'CRAWL_STATE_ENABLED': Settings.CRAWL_STATE_ENABLED,
+        'CRAWL_STATE_FLUSH_INTERVAL': Settings.CRAWL_STATE_FLUSH_INTERVAL,
+        'CRAWL_STATE_MAX_DECISION_ATTEMPTS': Settings.CRAWL_STATE_MAX_DECISION_ATTEMPTS,
+        'ADAPTIVE_MERGE_MONTHS': Settings.ADAPTIVE_MERGE_MONTHS,
+        'ADAPTIVE_MAX_PAGES': Settings.ADAPTIVE_MAX_PAGES,
         'LOG_LEVEL': 'DEBUG' if debug else 'INFO',
     }
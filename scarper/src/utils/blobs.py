@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+
+# content addressed attachments: every attachment is stored once under blobs/sha256/{hash[:2]}/{hash} and each case
+# folder only gets a small json reference ({name}.ref.json) pointing to it. the urls already stored are kept in
+# mongo (attachment_urls, url -> sha256 and the etag/last modified it was downloaded with) so an attachment linked
+# from many decisions is downloaded once, later crawls only revalidate it
+REF_SUFFIX = '.ref.json'
+
+def blob_key(prefix, sha256):
+    return f"{prefix}sha256/{sha256[:2]}/{sha256}"
+
+def staging_key(prefix, name):
+    return f"{prefix}staging/{name}"
+
+def ref_body(url, name, sha256, bucket_name, key, size, content_type):
+    # no timestamps in here, the same reference always has the same etag so the transformer sees the case unchanged
+    return json.dumps({
+        'name': name,
+        'url': url,
+        'sha256': sha256,
+        'blob': f"s3://{bucket_name}/{key}",
+        'size': size,
+        'content_type': content_type,
+    }, sort_keys=True).encode('utf-8')
+
+class AttachmentUrlCache:
+    collection_name = 'attachment_urls'
+
+    def __init__(self, client, mongo_db):
+        self.collection = client[mongo_db][self.collection_name]
+
+    def get(self, url):
+        return self.collection.find_one({'_id': url}, {'_id': 0, 'sha256': 1, 'key': 1, 'size': 1, 'content_type': 1, 'etag': 1, 'last_modified': 1})
+
+    def put(self, url, blob):
+        self.collection.update_one(
+            {'_id': url},
+            {'$set': {**blob, 'stored_at': datetime.utcnow()}},
+            upsert=True
+        )
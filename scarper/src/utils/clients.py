@@ -0,0 +1,34 @@
+import boto3
+import pymongo
+import threading
+from botocore.client import Config
+
+# mongo and s3 clients shared by everything in the process (pipelines, crawl checkpoints, http cache, the spider).
+# the cli runs one crawl and exits so it makes no difference there, the resident service (src/server.py) keeps
+# its connection pools and bucket checks between crawls instead of reconnecting for every spider
+_lock = threading.Lock()
+_mongo_clients = {}
+_s3_clients = {}
+# buckets already checked (or created) in this process
+checked_buckets = set()
+
+def mongo_client(uri):
+    with _lock:
+        if uri not in _mongo_clients:
+            _mongo_clients[uri] = pymongo.MongoClient(uri)
+        return _mongo_clients[uri]
+
+def s3_client(endpoint, access_key, secret_key, max_pool_connections=10):
+    key = (endpoint, access_key, secret_key)
+    with _lock:
+        # the pool only grows, a later pipeline with a higher upload concurrency gets a bigger one
+        client, pool_size = _s3_clients.get(key, (None, 0))
+        if client is None or pool_size < max_pool_connections:
+            client = boto3.client('s3',
+                                  endpoint_url=endpoint,
+                                  aws_access_key_id=access_key,
+                                  aws_secret_access_key=secret_key,
+                                  config=Config(signature_version='s3v4', max_pool_connections=max_pool_connections),
+                                  region_name='us-east-1')
+            _s3_clients[key] = (client, max_pool_connections)
+        return client
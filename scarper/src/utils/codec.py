@@ -0,0 +1,63 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# optional compression of the objects we store in minio (STORAGE_CODEC). a compressed object has the codec as its
+# Content-Encoding (and x-amz-meta-codec), hashes are always of the uncompressed content so file_hash means the same
+# with or without it. the manifests record the stored size with the raw one next to it (raw_size). readers
+# decompress by the header and take old objects as they are
+CODECS = ('none', 'gzip', 'zstd')
+
+# only text is worth compressing, pdfs/docx attachments are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml', 'application/xhtml')
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"unknown storage codec {codec}, expected one of {', '.join(CODECS)}")
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("storage codec zstd needs the zstandard package (pip install zstandard)")
+    return codec
+
+def codec_for(codec, content_type):
+    # codec to store an object of this content type with, None to store it as is
+    if codec in (None, 'none') or not (content_type or '').lower().startswith(COMPRESSIBLE_TYPES):
+        return None
+    return codec
+
+def storage_args(codec):
+    # extra put_object/create_multipart_upload arguments for a compressed object
+    if not codec:
+        return {}
+    return {'ContentEncoding': codec, 'Metadata': {'codec': codec}}
+
+class Compressor:
+    # streaming compressor, compress() returns whatever compressed bytes are ready and flush() the rest
+    def __init__(self, codec):
+        if codec == 'gzip':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif codec == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._compressor = None
+
+    def compress(self, data):
+        return self._compressor.compress(data) if self._compressor else data
+
+    def flush(self):
+        return self._compressor.flush() if self._compressor else b''
+
+def compress(data, codec):
+    compressor = Compressor(codec)
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(data, encoding):
+    if encoding == 'gzip':
+        return zlib.decompress(data, 31)
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("object is zstd compressed, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
@@ -0,0 +1,225 @@
+import hashlib
+from datetime import datetime
+from pymongo import DeleteOne, UpdateOne
+from twisted.internet import task
+from src.models.case import TRANSIENT_FIELDS
+from src.utils.clients import mongo_client
+
+# sent by the mongo pipeline with the urls of the records it just wrote, a decision only counts as done then
+records_stored = object()
+# sent by the mongo pipeline with (url, error) of the records it failed to write
+records_failed = object()
+
+def job_id_for(query, from_date, to_date, adaptive=False):
+    # same search -> same job, so a retried airflow task finds the state of the failed try
+    raw = '|'.join([query or '', from_date or '', to_date or '', 'adaptive' if adaptive else ''])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def window_key(window):
+    r_start, r_end = window
+    return f"{r_start.strftime('%d/%m/%Y')}-{r_end.strftime('%d/%m/%Y')}"
+
+# durable crawl state of one spider (one body, or all of them in single pass mode), one document in crawl_state:
+# partitions whose listing finished and fanned out pages already parsed. the decisions requested but not stored yet
+# are one document each in crawl_state_decisions (a big partition doesn't fit in one document), together with the
+# ones parked after failing too many times. kept in memory and written on a timer and when the spider closes,
+# --resume picks it up on the next run
+class CrawlState:
+    collection_name = 'crawl_state'
+    decisions_collection_name = 'crawl_state_decisions'
+
+    def __init__(self, mongo_uri, mongo_db, job_id, spider_key, flush_interval=10.0, max_decision_attempts=3):
+        self.mongo_uri = mongo_uri
+        self.mongo_db = mongo_db
+        self.job_id = job_id
+        self.doc_id = f"{job_id}:{spider_key}"
+        self.spider_key = spider_key
+        self.flush_interval = flush_interval
+        self.max_decision_attempts = max_decision_attempts
+        self.client = None
+        self.flush_loop = None
+
+        self.completed = set()
+        # window key -> page numbers parsed
+        self.pages = {}
+        # url -> item waiting for its decision page / mongo write
+        self.pending_decisions = {}
+        # url -> failed decision requests so far, and url -> (item, error) of the decisions given up on
+        self.attempts = {}
+        self.parked = {}
+        # urls whose decision document has to be written (or deleted) on the next flush
+        self.changed = set()
+        # a run that didn't load the state drops the pending decisions of the previous one on its first flush
+        self.loaded = False
+        # group -> listing requests in flight, and groups where one of them failed
+        self.outstanding = {}
+        self.failed_groups = set()
+        self.dirty = False
+
+    def open(self, spider):
+        self.client = mongo_client(self.mongo_uri)
+        try:
+            self.decisions.create_index([('state_id', 1), ('status', 1)])
+        except Exception as e:
+            spider.logger.warning(f"failed to create index on {self.decisions_collection_name}: {e}")
+        self.flush_loop = task.LoopingCall(self.flush, spider)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def close(self, spider, reason):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        # anything but a clean finish keeps the state resumable. parked decisions don't hold it back, they failed
+        # for good and are left in crawl_state_decisions to look at
+        self.flush(spider, finished=reason == 'finished' and not self.failed_groups and not self.pending_decisions)
+
+    @property
+    def collection(self):
+        return self.client[self.mongo_db][self.collection_name]
+
+    @property
+    def decisions(self):
+        return self.client[self.mongo_db][self.decisions_collection_name]
+
+    def _decision_id(self, url):
+        return f"{self.doc_id}|{url}"
+
+    def load(self, spider):
+        # returns True when there's an unfinished state to continue from
+        doc = self.collection.find_one({'_id': self.doc_id})
+        if not doc or doc.get('finished'):
+            return False
+
+        self.completed = set(doc.get('completed_partitions', []))
+        self.pages = {window: set(pages) for window, pages in doc.get('pages_seen', {}).items()}
+        self.pending_decisions = {}
+        for decision in self.decisions.find({'state_id': self.doc_id, 'status': 'pending'}):
+            self.pending_decisions[decision['url']] = decision['item']
+            if decision.get('attempts'):
+                self.attempts[decision['url']] = decision['attempts']
+        # states saved before the decisions had their own collection, moved there on the next flush
+        for item in doc.get('pending_decisions', []):
+            self.pending_decisions[item['url']] = item
+            self._changed(item['url'])
+        self.loaded = True
+        spider.logger.info(
+            f"resuming job {self.job_id} ({self.spider_key}): {len(self.completed)} partitions done, "
+            f"{len(self.pending_decisions)} pending decisions, last saved {doc.get('updated_at')}"
+        )
+        return True
+
+    def is_completed(self, group):
+        return group in self.completed
+
+    def seen_pages(self, window):
+        return self.pages.get(window_key(window), set())
+
+    def listing_started(self, group):
+        self.outstanding[group] = self.outstanding.get(group, 0) + 1
+
+    def listing_finished(self, group, failed=False):
+        if failed:
+            self.failed_groups.add(group)
+        self.outstanding[group] = self.outstanding.get(group, 1) - 1
+        if self.outstanding[group] <= 0 and group not in self.failed_groups:
+            # every page of the partition was listed, its decisions are in pending_decisions from now on
+            self.completed.add(group)
+            self.dirty = True
+
+    def page_done(self, window, page_number):
+        self.pages.setdefault(window_key(window), set()).add(page_number)
+        self.dirty = True
+
+    def decision_pending(self, item):
+        self.pending_decisions[item['url']] = {k: v for k, v in dict(item).items() if k not in TRANSIENT_FIELDS}
+        self._changed(item['url'])
+
+    def decision_failed(self, url, error):
+        # True while the decision can be requested again, after max_decision_attempts it's parked
+        self.attempts[url] = self.attempts.get(url, 0) + 1
+        if self.attempts[url] < self.max_decision_attempts:
+            self._changed(url)
+            return True
+        self._park(url, error)
+        return False
+
+    def records_stored(self, urls):
+        for url in urls:
+            self.attempts.pop(url, None)
+            if self.pending_decisions.pop(url, None) is not None:
+                self._changed(url)
+
+    def records_failed(self, records):
+        # a write that failed (e.g. a ref number already stored under another url) fails the same way next time
+        for url, error in records:
+            self._park(url, error)
+
+    def item_failed(self, item, failure=None, exception=None, **kwargs):
+        # item_error/item_dropped: a pipeline gave up on the item, it never gets to mongo
+        url = item.get('url') if item else None
+        if url:
+            self._park(url, str(failure.value if failure is not None else exception))
+
+    def _park(self, url, error):
+        item = self.pending_decisions.pop(url, None)
+        if item is None:
+            return
+        self.parked[url] = (item, error)
+        self._changed(url)
+
+    def _changed(self, url):
+        self.changed.add(url)
+        self.dirty = True
+
+    def _decision_operations(self, urls):
+        now = datetime.utcnow()
+        operations = []
+        for url in urls:
+            decision_id = self._decision_id(url)
+            if url in self.pending_decisions:
+                fields = {'item': self.pending_decisions[url], 'status': 'pending'}
+            elif url in self.parked:
+                item, error = self.parked[url]
+                fields = {'item': item, 'status': 'parked', 'error': error}
+            else:
+                operations.append(DeleteOne({'_id': decision_id, 'status': 'pending'}))
+                continue
+            fields.update({'state_id': self.doc_id, 'url': url, 'attempts': self.attempts.get(url, 0), 'updated_at': now})
+            operations.append(UpdateOne({'_id': decision_id}, {'$set': fields}, upsert=True))
+        return operations
+
+    def flush(self, spider, finished=False):
+        if not self.dirty and not finished:
+            return
+        self.dirty = False
+        changed, self.changed = self.changed, set()
+        try:
+            if not self.loaded:
+                self.decisions.delete_many({'state_id': self.doc_id, 'status': 'pending'})
+                self.loaded = True
+            # decisions first, a state saved as finished never has pending ones left behind
+            operations = self._decision_operations(changed)
+            if operations:
+                self.decisions.bulk_write(operations, ordered=False)
+            for url in changed:
+                self.parked.pop(url, None)
+            self.collection.update_one(
+                {'_id': self.doc_id},
+                {
+                    '$set': {
+                        'job_id': self.job_id,
+                        'spider': self.spider_key,
+                        'completed_partitions': sorted(self.completed),
+                        'pages_seen': {window: sorted(pages) for window, pages in self.pages.items()},
+                        'pending_count': len(self.pending_decisions),
+                        'finished': finished,
+                        'updated_at': datetime.utcnow(),
+                    },
+                    # states saved before the decisions had their own collection
+                    '$unset': {'pending_decisions': ''}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            self.dirty = True
+            self.changed |= changed
+            spider.logger.error(f"failed to save crawl state {self.doc_id}: {e}")
@@ -1,5 +1,5 @@
 import calendar
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 def add_months(sourcedate, months):
     month = sourcedate.month - 1 + months
@@ -28,3 +28,48 @@ def generate_date_ranges(start_date, end_date):
         current_start = next_start
         
     return ranges
+
+def parse_published_date(value):
+    # the site shows dates as dd/mm/yyyy, sometimes with spaces around them
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%d/%m/%Y")
+    except ValueError:
+        return None
+
+def merge_ranges(ranges, size):
+    # groups consecutive partitions into windows of `size` partitions, used to search quiet months together
+    merged = []
+    for i in range(0, len(ranges), size):
+        group = ranges[i:i + size]
+        merged.append((group[0][0], group[-1][1]))
+    return merged
+
+def split_range(start_date, end_date, ranges):
+    # next finer level for a window with too many results: its partitions, then weeks, then days
+    inner = [(max(s, start_date), min(e, end_date)) for s, e in ranges if s <= end_date and e >= start_date]
+    if len(inner) > 1:
+        return inner
+
+    days = (end_date - start_date).days + 1
+    step = 7 if days > 7 else 1
+    if days <= 1:
+        return []
+
+    sub_ranges = []
+    current_start = start_date
+    while current_start <= end_date:
+        current_end = min(current_start + timedelta(days=step - 1), end_date)
+        sub_ranges.append((current_start, current_end))
+        current_start = current_end + timedelta(days=1)
+    return sub_ranges
+
+def partition_for(date, ranges):
+    # the monthly partition a date belongs to, same label generate_date_ranges based crawls use
+    if date is None:
+        return None
+    for r_start, r_end in ranges:
+        if r_start <= date <= r_end:
+            return r_start.strftime("%m/%Y")
+    return None
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+from time import time
+from src.utils.codec import decompress
+
+# persistent http cache shared by the spider (decision pages, see src/middlewares/http_cache.py) and the minio
+# pipeline (files). one entry per url: a small json document with the validators (and for pages on disk the
+# status, headers and the body next to it). it lives on disk, or in minio so several workers and runs share it
+
+def entry_name(namespace, url):
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return f"{namespace}/{digest[:2]}/{digest}"
+
+def conditional_headers(entry):
+    # validators of a cached entry as request headers, empty when there's nothing to revalidate with
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def header_value(headers, name):
+    # scrapy title-cases header names (Etag), requests doesn't, so look them up ignoring the case
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+class DiskCacheStore:
+    keeps_bodies = True
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, namespace, url, with_body=False):
+        base = os.path.join(self.path, entry_name(namespace, url))
+        try:
+            with open(f"{base}.json", 'rb') as f:
+                entry = json.load(f)
+            body = None
+            if with_body:
+                with open(f"{base}.body", 'rb') as f:
+                    body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return entry, body
+
+    def put(self, namespace, url, entry, body=None):
+        base = os.path.join(self.path, entry_name(namespace, url))
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        # body first and entry last, a reader never finds an entry pointing to a half written body
+        if body is not None:
+            self._write(f"{base}.body", body)
+        self._write(f"{base}.json", json.dumps({**entry, 'stored_at': time()}).encode('utf-8'))
+
+    def _write(self, path, data):
+        # other workers may share the directory, write to a temp file and swap it in
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+# only the json entries live here, a body is read back from the object the pipeline stored (entry['key'])
+# instead of keeping a second copy of every page under the prefix
+class MinioCacheStore:
+    keeps_bodies = False
+
+    def __init__(self, s3_client, bucket_name, prefix='http-cache/'):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def get(self, namespace, url, with_body=False):
+        base = f"{self.prefix}{entry_name(namespace, url)}"
+        # anything going wrong is a cache miss, the url is just downloaded again
+        try:
+            entry = json.loads(self.s3_client.get_object(Bucket=self.bucket_name, Key=f"{base}.json")['Body'].read())
+            body = None
+            if with_body and entry.get('key'):
+                # the stored object may be compressed (STORAGE_CODEC)
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=entry['key'])
+                body = decompress(response['Body'].read(), response.get('ContentEncoding'))
+        except Exception:
+            return None, None
+        return entry, body
+
+    def put(self, namespace, url, entry, body=None):
+        # bodies aren't kept, see above
+        base = f"{self.prefix}{entry_name(namespace, url)}"
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=f"{base}.json",
+            Body=json.dumps({**entry, 'stored_at': time()}).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+def build_cache_store(backend, directory='.httpcache', prefix='http-cache/', s3_client=None, bucket_name=None):
+    if not backend:
+        return None
+    if backend == 'disk':
+        return DiskCacheStore(directory)
+    if backend == 'minio':
+        return MinioCacheStore(s3_client, bucket_name, prefix)
+    raise ValueError(f"unknown http cache backend {backend}")
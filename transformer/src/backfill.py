@@ -0,0 +1,15 @@
+import logging
+from src.services.mongo_service import MongoService
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    # one-off: adds the typed published_at field to records scraped before it existed
+    mongo_service = MongoService()
+    counts = mongo_service.backfill_published_at()
+    for collection_name, count in counts.items():
+        logger.info(f"backfilled published_at on {count} records in {collection_name}")
+
+if __name__ == "__main__":
+    main()
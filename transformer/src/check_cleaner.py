@@ -0,0 +1,58 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from src.services.mongo_service import MongoService
+from src.services.minio_service import MinioService
+from src.utils.utils import process_html_content, dom_signature
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    # runs a cleaner backend next to the bs4 reference on stored pages and reports any page where the output differs
+    parser = argparse.ArgumentParser(description='compare an html cleaner backend against the bs4 reference')
+    parser.add_argument('--start_date', required=True, help='start date (dd/mm/yyyy)')
+    parser.add_argument('--end_date', required=True, help='end date (dd/mm/yyyy)')
+    parser.add_argument('--backend', default='lxml', help='backend to compare with bs4')
+    parser.add_argument('--limit', type=int, default=0, help='max number of records to check (0 = all)')
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start_date, "%d/%m/%Y")
+    end_date = datetime.strptime(args.end_date, "%d/%m/%Y")
+
+    mongo_service = MongoService()
+    minio_service = MinioService()
+
+    docs = mongo_service.get_records_by_date_range(start_date, end_date)
+    if args.limit:
+        docs = docs.limit(args.limit)
+
+    counts = {'identical': 0, 'equivalent': 0, 'different': 0}
+    for doc in docs:
+        for s3_file_path in minio_service.list_files(doc['file_path']):
+            _, ext = os.path.splitext(s3_file_path)
+            if ext.lower() not in ['.html', '.htm']:
+                continue
+
+            content, _ = minio_service.get_file_content(s3_file_path)
+            if content is None:
+                continue
+
+            reference = process_html_content(content, 'bs4')
+            candidate = process_html_content(content, args.backend)
+
+            if candidate == reference:
+                counts['identical'] += 1
+            elif dom_signature(candidate) == dom_signature(reference):
+                counts['equivalent'] += 1
+            else:
+                counts['different'] += 1
+                logger.warning(f"{args.backend} output differs from bs4 for {s3_file_path}")
+
+    logger.info(f"byte identical: {counts['identical']}, dom equivalent: {counts['equivalent']}, different: {counts['different']}")
+    sys.exit(1 if counts['different'] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+from src.services.mongo_service import MongoService
+from src.services.minio_service import MinioService
+from src.settings import Settings
+from src.utils.utils import extract_text
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def export_schema():
+    # partition_date isn't a column, it's the hive directory (partition_date=MM-YYYY) of each file
+    return pa.schema([
+        ('ref_number', pa.string()),
+        ('url', pa.string()),
+        ('description', pa.string()),
+        ('published_date', pa.string()),
+        ('published_at', pa.timestamp('ms')),
+        ('scraped_at', pa.timestamp('ms')),
+        ('processed_at', pa.timestamp('ms')),
+        ('exported_at', pa.timestamp('ms')),
+        ('body_filters', pa.list_(pa.string())),
+        ('file_path', pa.string()),
+        ('file_hash', pa.string()),
+        ('source_hash', pa.string()),
+        ('additional_files', pa.list_(pa.string())),
+        ('text', pa.string()),
+    ])
+
+# writes the processed records to a parquet dataset in TARGET_BUCKET under EXPORT_PREFIX, one directory per
+# partition_date. every run appends new files with the records that are new or were reprocessed since they were
+# last exported, so a record can be in several files: the row with the latest exported_at is the current one
+class Exporter:
+    def __init__(self, io_workers=8, batch_size=Settings.EXPORT_BATCH_SIZE, compression='zstd'):
+        self.mongo_service = MongoService()
+        self.minio_service = MinioService()
+        self.io_workers = io_workers
+        self.batch_size = batch_size
+        self.compression = compression
+        self.schema = export_schema()
+
+    def run(self, start_date, end_date, everything=False):
+        exported_at = datetime.utcnow()
+        run_id = f"{exported_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        docs = self.mongo_service.get_records_to_export(start_date, end_date, everything)
+
+        exported = 0
+        files = 0
+        with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(self.io_workers) as io_pool:
+            partition, writer, path, ids = None, None, None, []
+            batch = []
+            for doc in docs:
+                doc_partition = (doc.get('partition_date') or 'unknown').replace('/', '-')
+                if doc_partition != partition or len(batch) >= self.batch_size:
+                    # records come in published order, a partition is done once the next one starts
+                    self._write_batch(writer, batch, exported_at, io_pool)
+                    batch = []
+                    if doc_partition != partition:
+                        exported += self._finish_file(partition, writer, path, ids, exported_at)
+                        files += 1 if writer else 0
+                        partition, ids = doc_partition, []
+                        path = os.path.join(tmp_dir, f"part-{run_id}-{files}.parquet")
+                        writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+                batch.append(doc)
+                ids.append(doc['_id'])
+
+            self._write_batch(writer, batch, exported_at, io_pool)
+            exported += self._finish_file(partition, writer, path, ids, exported_at)
+            files += 1 if writer else 0
+
+        logger.info(f"export finished. {exported} records in {files} files")
+        return exported
+
+    def _write_batch(self, writer, docs, exported_at, io_pool):
+        # one row group per batch, only the batch (and the pages being fetched) is in memory
+        if not docs:
+            return
+        rows = list(io_pool.map(lambda doc: self._row(doc, exported_at), docs))
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def _finish_file(self, partition, writer, path, ids, exported_at):
+        if writer is None:
+            return 0
+        writer.close()
+        key = f"{Settings.EXPORT_PREFIX}partition_date={partition}/{os.path.basename(path)}"
+        self.minio_service.upload_local_file(key, path, content_type='application/vnd.apache.parquet')
+        os.remove(path)
+        # only marked once the file is in minio, a failed run exports the same records again
+        self.mongo_service.mark_exported(ids, exported_at)
+        logger.info(f"exported {len(ids)} records of partition {partition} to {key}")
+        return len(ids)
+
+    def _row(self, doc, exported_at):
+        return {
+            'ref_number': (doc.get('ref_number') or '').strip() or None,
+            'url': doc.get('url'),
+            'description': doc.get('description'),
+            'published_date': doc.get('published_date'),
+            'published_at': doc.get('published_at'),
+            'scraped_at': doc.get('scraped_at'),
+            'processed_at': doc.get('processed_at'),
+            'exported_at': exported_at,
+            'body_filters': doc.get('body_filters') or [],
+            'file_path': doc.get('file_path'),
+            'file_hash': doc.get('file_hash'),
+            'source_hash': doc.get('source_hash'),
+            'additional_files': doc.get('additional_files') or [],
+            'text': self._text(doc),
+        }
+
+    def _text(self, doc):
+        # the main file is {ref_number}{extension of the url} in the processed folder, same name the scraper gave it
+        ref_number = (doc.get('ref_number') or '').strip()
+        file_path = doc.get('file_path')
+        if not ref_number or not file_path:
+            return None
+        _, ext = os.path.splitext(doc.get('url') or '')
+        if not ext:
+            ext = '.html'
+        if ext.lower() not in ['.html', '.htm']:
+            return None
+        parsed = urlparse(file_path)
+        content, _ = self.minio_service.get_file_content(f"s3://{parsed.netloc}/{parsed.path.strip('/')}/{ref_number}{ext}")
+        return extract_text(content)
+
+def main():
+    parser = argparse.ArgumentParser(description='export processed decisions to parquet')
+    parser.add_argument('--start_date', required=True, help='start date (dd/mm/yyyy)')
+    parser.add_argument('--end_date', required=True, help='end date (dd/mm/yyyy)')
+    parser.add_argument('--full', action='store_true', help='export every record in the range, not only new or reprocessed ones')
+    parser.add_argument('--io_workers', type=int, default=8, help='threads fetching the processed pages from minio')
+    parser.add_argument('--batch_size', type=int, default=Settings.EXPORT_BATCH_SIZE, help='records per parquet row group')
+    args = parser.parse_args()
+
+    if pa is None:
+        logger.error("the parquet export needs pyarrow (pip install pyarrow)")
+        sys.exit(1)
+
+    start_date = datetime.strptime(args.start_date, "%d/%m/%Y")
+    end_date = datetime.strptime(args.end_date, "%d/%m/%Y")
+    Exporter(io_workers=args.io_workers, batch_size=args.batch_size).run(start_date, end_date, everything=args.full)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,58 @@
 import argparse
+import json
 import logging
+import multiprocessing
 import os
-from datetime import datetime
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from pymongo.errors import OperationFailure
+from src.services.lease_service import LeaseService, lease_id
 from src.services.mongo_service import MongoService
 from src.services.minio_service import MinioService
-from src.utils.utils import process_html_content, calculate_hash
+from src.utils.utils import clean_and_hash
 from src.settings import Settings
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ChangeStreamHistoryLost / ChangeStreamFatalError: the stored resume token isn't in the oplog anymore
+CHANGE_STREAM_HISTORY_LOST = (280, 286)
+
+def change_streams_unsupported(error):
+    # a standalone mongo (like the local docker one) only runs change streams on replica sets
+    return error.code == 40573 or 'replica set' in str(error)
+
+def written_at(doc):
+    # write time set by the scraper's mongo pipeline, records stored before it had one only have scraped_at
+    return doc.get('updated_at') or doc.get('scraped_at')
+
+def blob_key(sha256):
+    # same layout as the scraper's blobs, a processed blob keeps the hash of the raw blob it was made from
+    return f"{Settings.BLOB_PREFIX}sha256/{sha256[:2]}/{sha256}"
+
 class Transformer:
-    def __init__(self):
+    def __init__(self, io_workers=8, cpu_workers=None, serial=False, html_cleaner=Settings.HTML_CLEANER, force=False):
         self.mongo_service = MongoService()
         self.minio_service = MinioService()
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers or os.cpu_count()
+        self.serial = serial
+        self.html_cleaner = html_cleaner
+        self.force = force
+        # ref_number -> inputs the processed record was built from, filled per run
+        self.processed_sources = {}
+        # partition -> manifest (or None when missing), each one is fetched once per run
+        self.manifests = {}
+        self.manifests_lock = threading.Lock()
+        # (io pool, cpu pool) kept open between runs by the resident service (src/server.py)
+        self.pools = None
+        # shared attachment blobs already in the target bucket
+        self.processed_blobs = set()
 
     def run(self, start_date_str, end_date_str):
         try:
@@ -26,87 +65,502 @@ class Transformer:
         logger.info(f"processing records from {start_date_str} to {end_date_str}")
         
         docs = self.mongo_service.get_records_by_date_range(start_date, end_date)
+        self.manifests = {}
+        if not self.force:
+            self.processed_sources = self.mongo_service.get_processed_sources(start_date, end_date)
+
+        if self.serial:
+            processed_count = self._run_serial(docs)
+        else:
+            processed_count = self._run_pipelined(docs)
+
+        self.mongo_service.flush()
+        logger.info(f"transformer finished. processed {processed_count} records.")
+        return processed_count
+
+    def _run_serial(self, docs):
+        # one document at a time, easier to follow when debugging
         processed_count = 0
-        
         for doc in docs:
-            ref_number = doc.get('ref_number')
-            if ref_number:
-                # after testing turns out ref number has leading/trailing spaces in some cases
-                ref_number = ref_number.strip()
-            
-            file_path = doc.get('file_path')
-            
-            if not ref_number or not file_path:
-                logger.warning(f"skipping doc with missing ref_number or file_path: {doc.get('_id')}")
+            new_record = self._process_doc(doc)
+            if new_record:
+                self.mongo_service.upsert_processed_record(new_record)
+                processed_count += 1
+        return processed_count
+
+    def _run_pipelined(self, docs):
+        if self.pools:
+            return self._process_all(docs, *self.pools)
+        with self._pools() as (io_pool, cpu_pool):
+            return self._process_all(docs, io_pool, cpu_pool)
+
+    @contextmanager
+    def _pools(self):
+        # workers are spawned (not forked) since the io threads and the mongo client already exist at that point
+        with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool, \
+                ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context('spawn')) as cpu_pool:
+            yield io_pool, cpu_pool
+
+    def _process_all(self, docs, io_pool, cpu_pool):
+        # minio get/put runs on a thread pool, cleaning/hashing on a process pool and this thread is the only mongo writer.
+        # the number of documents in flight is bounded so a big date range doesn't pile up in memory
+        processed_count = 0
+        max_in_flight = self.io_workers * 2
+
+        in_flight = set()
+        for doc in docs:
+            in_flight.add(io_pool.submit(self._process_doc, doc, cpu_pool))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                processed_count += self._write_results(done)
+
+        done, _ = wait(in_flight)
+        processed_count += self._write_results(done)
+
+        return processed_count
+
+    def follow(self):
+        # processes records as soon as the scraper writes them, through a change stream on the source collection
+        # or by polling updated_at when mongo doesn't support change streams. runs until interrupted
+        state = self.mongo_service.get_follow_state()
+        # serial mode processes batches on this thread, no pools
+        with (nullcontext() if self.serial else self._pools()) as pools:
+            try:
+                self._follow_change_stream(state, pools)
+            except OperationFailure as e:
+                if not change_streams_unsupported(e):
+                    raise
+                logger.info(f"change streams not available ({e}), polling {Settings.SOURCE_COLLECTION} on updated_at instead")
+                self._follow_polling(state, pools)
+
+    def _follow_change_stream(self, state, pools):
+        resume_token = state.get('resume_token')
+        watermark = state.get('watermark')
+        try:
+            stream = self.mongo_service.watch_source(resume_token)
+        except OperationFailure as e:
+            if resume_token is None or e.code not in CHANGE_STREAM_HISTORY_LOST:
+                raise
+            # the stream is opened first so nothing written during the catch up is missed
+            logger.warning(f"resume token is gone from the oplog, catching up from {watermark} instead")
+            resume_token = None
+            self.mongo_service.clear_resume_token()
+            stream = self.mongo_service.watch_source()
+            watermark = self._poll_once(watermark, {}, pools)
+
+        logger.info(f"following {Settings.SOURCE_COLLECTION} changes" + (" from the stored resume token" if resume_token else ""))
+        batch = {}
+        batch_started = None
+        with stream:
+            while True:
+                change = stream.try_next()
+                doc = change.get('fullDocument') if change else None
+                # a record is ready once the scraper stored its files
+                if doc and doc.get('file_path'):
+                    batch[doc['_id']] = doc
+                    batch_started = batch_started or time.monotonic()
+
+                if batch and (len(batch) >= Settings.FOLLOW_BATCH_SIZE or time.monotonic() - batch_started >= Settings.FOLLOW_BATCH_WAIT):
+                    watermark = self._process_batch(list(batch.values()), pools, watermark)
+                    batch, batch_started = {}, None
+
+                # the resume point only moves past records once they're processed and written
+                if not batch and stream.resume_token != resume_token:
+                    resume_token = stream.resume_token
+                    self.mongo_service.save_follow_state(resume_token=resume_token, watermark=watermark)
+
+    def _follow_polling(self, state, pools):
+        watermark = state.get('watermark') or datetime.utcnow()
+        logger.info(f"polling {Settings.SOURCE_COLLECTION} for records written after {watermark}")
+        # _id -> version of the records seen inside the overlap window, so they're not processed again every poll
+        seen = {}
+        while True:
+            new_watermark = self._poll_once(watermark, seen, pools)
+            if new_watermark != watermark:
+                watermark = new_watermark
+                self.mongo_service.save_follow_state(watermark=watermark)
+            time.sleep(Settings.FOLLOW_POLL_INTERVAL)
+
+    def _poll_once(self, watermark, seen, pools):
+        # updated_at is the write time, but a write can become visible a moment after a later one (concurrent
+        # bulk writes), so each poll looks back FOLLOW_POLL_OVERLAP seconds
+        overlap = timedelta(seconds=Settings.FOLLOW_POLL_OVERLAP)
+        batch = []
+        for doc in self.mongo_service.get_source_records_since(watermark - overlap if watermark else None):
+            version = (written_at(doc), doc.get('file_path'), doc.get('file_hash'))
+            if seen.get(doc['_id']) == version:
                 continue
+            seen[doc['_id']] = version
+            batch.append(doc)
+            if len(batch) >= Settings.FOLLOW_BATCH_SIZE:
+                watermark = self._process_batch(batch, pools, watermark)
+                batch = []
+        if batch:
+            watermark = self._process_batch(batch, pools, watermark)
 
-            _, ext = os.path.splitext(file_path)
-            logger.info(f"processing case {ref_number}")
-            source_files = self.minio_service.list_files(file_path)
-            
-            if not source_files:
-                logger.warning(f"no files found in {file_path}")
+        if watermark:
+            cutoff = watermark - overlap
+            for _id in [_id for _id, version in seen.items() if not version[0] or version[0] < cutoff]:
+                del seen[_id]
+        return watermark
+
+    def _process_batch(self, docs, pools, watermark):
+        # returns the watermark moved to the newest record of the batch
+        self.manifests = {}
+        if not self.force:
+            self.processed_sources = self.mongo_service.get_processed_sources_for([doc.get('ref_number') for doc in docs])
+
+        if pools is None:
+            processed_count = self._run_serial(docs)
+        else:
+            processed_count = self._process_all(docs, *pools)
+        self.mongo_service.flush()
+        logger.info(f"follow: processed {processed_count} of {len(docs)} changed records")
+
+        written = [written_at(doc) for doc in docs if written_at(doc)]
+        if written and (watermark is None or max(written) > watermark):
+            return max(written)
+        return watermark
+
+    def work(self, start_date_str, end_date_str, worker_id=None):
+        # one of several workers sharing a date range (on any host). records are claimed in batches through leases
+        # in mongo so each one is processed by a single worker, see src/services/lease_service.py
+        try:
+            start_date = datetime.strptime(start_date_str, "%d/%m/%Y")
+            end_date = datetime.strptime(end_date_str, "%d/%m/%Y")
+        except ValueError as e:
+            logger.error(f"invalid date format. use dd/mm/yyyy. error: {e}")
+            return
+
+        owner = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        leases = LeaseService(self.mongo_service.db, owner)
+        logger.info(f"worker {owner} processing records from {start_date_str} to {end_date_str}")
+
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(leases, stop), daemon=True).start()
+        processed_count = 0
+        try:
+            with (nullcontext() if self.serial else self._pools()) as pools:
+                # workers walk the range in the same order, records someone else claimed are skipped right away
+                batch = []
+                for doc in self.mongo_service.get_records_by_date_range(start_date, end_date):
+                    batch.append(doc)
+                    if len(batch) >= Settings.LEASE_BATCH_SIZE:
+                        processed_count += self._work_batch(batch, leases, pools)[0]
+                        batch = []
+                processed_count += self._work_batch(batch, leases, pools)[0]
+
+                # then the leases lost by crashed workers or failed (after their backoff) are picked up, until no
+                # live worker holds any and no failed lease is waiting for a retry
+                while True:
+                    written, progressed = self._reclaim(start_date, end_date, leases, pools)
+                    processed_count += written
+                    if progressed:
+                        continue
+                    if not leases.others_active(start_date, end_date) and not leases.retries_pending(start_date, end_date):
+                        break
+                    time.sleep(min(Settings.LEASE_TTL / 4, Settings.LEASE_RETRY_BACKOFF))
+        finally:
+            stop.set()
+
+        logger.info(f"worker {owner} finished. processed {processed_count} records.")
+
+    def _reclaim(self, start_date, end_date, leases, pools):
+        # one pass over the reclaimable leases, returns (records written, whether anything was claimed or settled)
+        written, progressed = 0, False
+        reclaimable = leases.reclaimable(start_date, end_date)
+        for i in range(0, len(reclaimable), Settings.LEASE_BATCH_SIZE):
+            chunk = reclaimable[i:i + Settings.LEASE_BATCH_SIZE]
+            ids = {lease['_id'] for lease in chunk}
+            docs = [doc for doc in self.mongo_service.get_records_by_ids([lease['source_id'] for lease in chunk]) if lease_id(doc) in ids]
+            # no record for the lease anymore (deleted, lost its file, or re-scraped under a new lease id)
+            stale = list(ids - {lease_id(doc) for doc in docs})
+            if stale:
+                leases.supersede(stale)
+                progressed = True
+            batch_written, claimed = self._work_batch(docs, leases, pools)
+            written += batch_written
+            progressed = progressed or claimed > 0
+        return written, progressed
+
+    def _heartbeat(self, leases, stop):
+        while not stop.wait(Settings.LEASE_TTL / 3):
+            try:
+                leases.heartbeat()
+            except Exception as e:
+                logger.warning(f"lease heartbeat failed: {e}")
+
+    def _work_batch(self, docs, leases, pools):
+        # returns (records written, leases claimed)
+        claimed = leases.claim(docs)
+        if not claimed:
+            return 0, 0
+        if not self.force:
+            self.processed_sources = self.mongo_service.get_processed_sources_for([doc.get('ref_number') for doc in claimed])
+
+        if pools is None:
+            outcomes = []
+            for doc in claimed:
+                try:
+                    outcomes.append((doc, self._process_doc(doc), None))
+                except Exception as e:
+                    outcomes.append((doc, None, e))
+        else:
+            io_pool, cpu_pool = pools
+            futures = [(doc, io_pool.submit(self._process_doc, doc, cpu_pool)) for doc in claimed]
+            outcomes = []
+            for doc, future in futures:
+                try:
+                    outcomes.append((doc, future.result(), None))
+                except Exception as e:
+                    outcomes.append((doc, None, e))
+
+        done, failed, written = [], [], 0
+        not_written = set()
+        for doc, new_record, error in outcomes:
+            if error:
+                logger.error(f"failed to process record {doc.get('ref_number')}: {error}")
+                failed.append(doc)
                 continue
+            if new_record:
+                not_written.update(self.mongo_service.upsert_processed_record(new_record))
+                written += 1
+            # a partially processed case is written but its lease is failed, so it's retried
+            if new_record and new_record.get('source_etags') is None:
+                failed.append(doc)
+            else:
+                done.append(doc)
 
-            partition_date = doc.get('partition_date', 'unknown').replace('/', '-')
-            published_date = doc.get('published_date', 'unknown').replace('/', '-')
-            
-            target_prefix = f"files/{partition_date}/{published_date}/{ref_number}/"
-            
-            processed_attachments = []
-            main_file_hash = None
-            
-            for s3_file_path in source_files:
-                content, obj_name = self.minio_service.get_file_content(s3_file_path)
-                if content is None:
-                    continue
-                
-                fname = os.path.basename(obj_name)
-                _, fext = os.path.splitext(fname)
-                is_html = fext.lower() in ['.html', '.htm']
-                
-                new_content = content
-                if is_html:
-                    new_content = process_html_content(content)
-                
-                new_filename = f"{target_prefix}{fname}"
-                
+        # leases are only completed once the records are in mongo
+        not_written.update(self.mongo_service.flush())
+        failed.extend(doc for doc in done if doc.get('ref_number') in not_written)
+        leases.complete([doc for doc in done if doc.get('ref_number') not in not_written])
+        leases.fail(failed)
+        return written, len(claimed)
+
+    def _write_results(self, futures):
+        written = 0
+        for future in futures:
+            try:
+                new_record = future.result()
+            except Exception as e:
+                logger.error(f"failed to process record: {e}")
+                continue
+            if new_record:
+                self.mongo_service.upsert_processed_record(new_record)
+                written += 1
+        return written
+
+    def _get_manifest(self, partition):
+        with self.manifests_lock:
+            if partition not in self.manifests:
+                self.manifests[partition] = self.minio_service.get_manifest(partition)
+            return self.manifests[partition]
+
+    def _list_source_files(self, doc, file_path):
+        # uses the partition manifest when it knows this case, listing the folder is the fallback
+        parsed = urlparse(file_path)
+        bucket_name = parsed.netloc
+        prefix = parsed.path.lstrip('/')
+        parts = prefix.rstrip('/').split('/')
+
+        if len(parts) == 4 and parts[0] == 'files':
+            manifest = self._get_manifest(parts[1])
+            if manifest and not self._is_manifest_stale(manifest, doc):
+                entries = [e for e in manifest.get('cases', {}).get(parts[3], []) if e['key'].startswith(prefix)]
+                if entries:
+                    return {f"s3://{bucket_name}/{e['key']}": e['etag'] for e in entries}
+
+        return self.minio_service.list_files_with_etags(file_path)
+
+    def _is_manifest_stale(self, manifest, doc):
+        # a case scraped after the manifest was written may have files the manifest doesn't know about
+        scraped_at = doc.get('scraped_at')
+        try:
+            generated_at = datetime.fromisoformat(manifest['generated_at'])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return bool(scraped_at and scraped_at > generated_at)
+
+    def _process_doc(self, doc, cpu_pool=None):
+        ref_number = doc.get('ref_number')
+        if ref_number:
+            # after testing turns out ref number has leading/trailing spaces in some cases
+            ref_number = ref_number.strip()
+        
+        file_path = doc.get('file_path')
+        
+        if not ref_number or not file_path:
+            logger.warning(f"skipping doc with missing ref_number or file_path: {doc.get('_id')}")
+            return None
+
+        source_etags = self._list_source_files(doc, file_path)
+        source_files = list(source_etags)
+        
+        if not source_files:
+            logger.warning(f"no files found in {file_path}")
+            return None
+
+        # the scraper's hash covers the raw main file, the etags cover every object (attachments included)
+        source_hash = doc.get('file_hash')
+        etags = sorted(
+            [{'name': os.path.basename(path), 'etag': etag} for path, etag in source_etags.items()],
+            key=lambda entry: entry['name']
+        )
+        previous = self.processed_sources.get(ref_number)
+        if previous and previous['source_hash'] == source_hash and previous['source_etags'] == etags:
+            logger.debug(f"case {ref_number} unchanged since last run, skipping")
+            return None
+
+        logger.info(f"processing case {ref_number}")
+
+        partition_date = doc.get('partition_date', 'unknown').replace('/', '-')
+        published_date = doc.get('published_date', 'unknown').replace('/', '-')
+        
+        target_prefix = f"files/{partition_date}/{published_date}/{ref_number}/"
+        
+        processed_attachments = []
+        main_file_hash = None
+        failed = False
+        
+        for s3_file_path in source_files:
+            fname = os.path.basename(s3_file_path)
+            _, fext = os.path.splitext(fname)
+            is_html = fext.lower() in ['.html', '.htm']
+            is_main = fname.startswith(ref_number)
+            new_filename = f"{target_prefix}{fname}"
+
+            # attachments the scraper stored once for every case (see scarper/src/utils/blobs.py), only the
+            # reference is per case, the blob is processed once and the record points at it
+            if fname.endswith(Settings.BLOB_REF_SUFFIX):
                 try:
-                    uploaded_path = self.minio_service.upload_file(
-                        new_filename, 
-                        new_content, 
-                        content_type='text/html' if is_html else 'application/octet-stream'
-                    )
-                    
-                    if fname.startswith(ref_number):
-                        main_file_hash = calculate_hash(new_content)
+                    processed_attachments.append(self._process_blob_ref(s3_file_path, new_filename, cpu_pool))
+                except Exception as e:
+                    logger.error(f"failed to process attachment reference {s3_file_path}: {e}")
+                    failed = True
+                continue
+
+            # files we don't modify are copied inside minio, the main file's hash is the scraper's hash of the same bytes.
+            # a main file without that hash is streamed through so it can be hashed without loading it whole
+            if not is_html:
+                try:
+                    if is_main and not source_hash:
+                        uploaded_path, file_hash = self.minio_service.stream_file(s3_file_path, new_filename)
                     else:
-                        processed_attachments.append(uploaded_path)
-                        
+                        uploaded_path, file_hash = self.minio_service.copy_file(s3_file_path, new_filename), source_hash
                 except Exception:
-                    logger.error(f"failed to process/upload {fname}")
+                    failed = True
                     continue
+                if is_main:
+                    main_file_hash = file_hash
+                else:
+                    processed_attachments.append(uploaded_path)
+                continue
+
+            content, _ = self.minio_service.get_file_content(s3_file_path)
+            if content is None:
+                failed = True
+                continue
             
-            new_record = doc.copy()
-            new_record['file_path'] = f"s3://{Settings.TARGET_BUCKET}/{target_prefix}"
-            new_record['file_hash'] = main_file_hash
-            new_record['additional_files'] = processed_attachments
-            
-            self.mongo_service.upsert_processed_record(new_record)
-            
-            processed_count += 1
+            if cpu_pool:
+                new_content, file_hash = cpu_pool.submit(clean_and_hash, content, is_html, is_main, self.html_cleaner).result()
+            else:
+                new_content, file_hash = clean_and_hash(content, is_html, is_main, self.html_cleaner)
             
-        logger.info(f"transformer finished. processed {processed_count} records.")
+            try:
+                uploaded_path = self.minio_service.upload_file(
+                    new_filename, 
+                    new_content, 
+                    content_type='text/html' if is_html else 'application/octet-stream'
+                )
+                
+                if is_main:
+                    main_file_hash = file_hash
+                else:
+                    processed_attachments.append(uploaded_path)
+                    
+            except Exception:
+                logger.error(f"failed to process/upload {fname}")
+                failed = True
+                continue
+        
+        new_record = doc.copy()
+        new_record['file_path'] = f"s3://{Settings.TARGET_BUCKET}/{target_prefix}"
+        new_record['file_hash'] = main_file_hash
+        new_record['additional_files'] = processed_attachments
+        # a partially processed case keeps no memo so the next run picks it up again
+        new_record['source_hash'] = source_hash
+        new_record['source_etags'] = None if failed else etags
+        return new_record
+
+    def _process_blob_ref(self, s3_file_path, ref_filename, cpu_pool=None):
+        content, _ = self.minio_service.get_file_content(s3_file_path)
+        if content is None:
+            raise ValueError("reference not readable")
+        ref = json.loads(content)
+        target_key = blob_key(ref['sha256'])
+
+        if target_key not in self.processed_blobs and not self.minio_service.file_exists(target_key):
+            _, ext = os.path.splitext(ref['name'])
+            if ext.lower() in ['.html', '.htm']:
+                content, _ = self.minio_service.get_file_content(ref['blob'])
+                if content is None:
+                    raise ValueError(f"blob {ref['blob']} not readable")
+                if cpu_pool:
+                    new_content, _ = cpu_pool.submit(clean_and_hash, content, True, False, self.html_cleaner).result()
+                else:
+                    new_content, _ = clean_and_hash(content, True, False, self.html_cleaner)
+                self.minio_service.upload_file(target_key, new_content, content_type='text/html')
+            else:
+                self.minio_service.copy_file(ref['blob'], target_key)
+        self.processed_blobs.add(target_key)
+
+        blob_path = f"s3://{Settings.TARGET_BUCKET}/{target_key}"
+        # the processed case folder gets its own reference so listing it still shows every attachment
+        self.minio_service.upload_file(
+            ref_filename,
+            json.dumps({**ref, 'blob': blob_path}, sort_keys=True).encode('utf-8'),
+            content_type='application/json'
+        )
+        return blob_path
 
 def main():
     parser = argparse.ArgumentParser(description='wrc transformer')
-    parser.add_argument('--start_date', required=True, help='start date (dd/mm/yyyy)')
-    parser.add_argument('--end_date', required=True, help='end date (dd/mm/yyyy)')
+    parser.add_argument('--start_date', help='start date (dd/mm/yyyy)')
+    parser.add_argument('--end_date', help='end date (dd/mm/yyyy)')
+    parser.add_argument('--follow', action='store_true', help='keep running and process records as soon as they are scraped')
+    parser.add_argument('--worker', action='store_true', help='share the date range with other workers, records are claimed through leases')
+    parser.add_argument('--worker_id', default=None, help='lease owner name in worker mode (default: hostname-pid)')
+    parser.add_argument('--io_workers', type=int, default=8, help='threads used for minio downloads/uploads')
+    parser.add_argument('--cpu_workers', type=int, default=None, help='processes used for html cleaning and hashing (default: cpu count)')
+    parser.add_argument('--serial', action='store_true', help='process one record at a time (debugging)')
+    parser.add_argument('--force', action='store_true', help='reprocess records even if their source files did not change')
+    parser.add_argument('--html_cleaner', choices=['bs4', 'lxml'], default=Settings.HTML_CLEANER, help='html cleaning backend')
     
     args = parser.parse_args()
+    if not args.follow and not (args.start_date and args.end_date):
+        parser.error('--start_date and --end_date are required unless --follow is used')
+    if args.worker and args.force:
+        # a done lease is never claimed again, forced workers would only reprocess what nobody processed yet
+        parser.error('--force does not work with --worker, run a single transformer with --force to reprocess a range')
     
-    transformer = Transformer()
-    transformer.run(args.start_date, args.end_date)
+    transformer = Transformer(
+        io_workers=args.io_workers,
+        cpu_workers=args.cpu_workers,
+        serial=args.serial,
+        html_cleaner=args.html_cleaner,
+        force=args.force
+    )
+    if args.worker:
+        transformer.work(args.start_date, args.end_date, worker_id=args.worker_id)
+    elif args.follow:
+        try:
+            transformer.follow()
+        except KeyboardInterrupt:
+            # everything processed so far is written, the next --follow continues from the saved resume point
+            logger.info("stopped following")
+    else:
+        transformer.run(args.start_date, args.end_date)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,148 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.main import Transformer
+from src.settings import Settings
+from src.utils.utils import clean_and_hash
+
+IMPORTS_DONE_AT = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# resident transformer: the mongo/minio clients, the bucket check and the io/cpu pools are set up once and
+# jobs submitted over http run one after the other on the same Transformer (a run keeps per range state)
+class TransformerService:
+    def __init__(self, transformer):
+        self.transformer = transformer
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.startup = {}
+        threading.Thread(target=self._run_jobs, daemon=True).start()
+
+    def warm_up(self):
+        # spawned cpu workers import the cleaner on their first task, do it now for every worker
+        started = time.perf_counter()
+        io_pool, cpu_pool = self.transformer.pools
+        workers = self.transformer.cpu_workers
+        list(cpu_pool.map(clean_and_hash, [b'<html></html>'] * workers, [True] * workers, [True] * workers, [self.transformer.html_cleaner] * workers))
+        return time.perf_counter() - started
+
+    def submit(self, params):
+        for field in ('start_date', 'end_date'):
+            datetime.strptime(params.get(field) or '', "%d/%m/%Y")
+        job = {
+            'id': uuid.uuid4().hex,
+            'params': params,
+            'status': 'queued',
+            'submitted_at': datetime.utcnow().isoformat(),
+        }
+        self.jobs[job['id']] = job
+        self.queue.put(job)
+        return job
+
+    def _run_jobs(self):
+        while True:
+            job = self.queue.get()
+            job['status'] = 'running'
+            job['started_at'] = datetime.utcnow().isoformat()
+            started = time.perf_counter()
+            logger.info(f"job {job['id']} started: {job['params']}")
+            try:
+                self.transformer.force = bool(job['params'].get('force'))
+                processed_count = self.transformer.run(job['params']['start_date'], job['params']['end_date'])
+                job['result'] = {'processed': processed_count}
+                job['status'] = 'done'
+            except Exception as e:
+                logger.error(f"job {job['id']} failed: {e}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            job['finished_at'] = datetime.utcnow().isoformat()
+            job['duration'] = round(time.perf_counter() - started, 3)
+            logger.info(f"job {job['id']} {job['status']} in {job['duration']}s")
+
+    def health(self):
+        statuses = [job['status'] for job in list(self.jobs.values())]
+        return {
+            'status': 'ok',
+            'uptime': round(time.perf_counter() - STARTED_AT, 3),
+            'startup': self.startup,
+            'jobs': {status: statuses.count(status) for status in set(statuses)},
+        }
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        path = self.path.strip('/').split('/')
+        if path == ['health']:
+            return self._json(200, self.service.health())
+        if len(path) == 2 and path[0] == 'jobs' and path[1] in self.service.jobs:
+            return self._json(200, self.service.jobs[path[1]])
+        self._json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.strip('/') != 'jobs':
+            return self._json(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length) or b'{}')
+            job = self.service.submit(params)
+        except (ValueError, TypeError) as e:
+            return self._json(400, {'error': f"invalid job: {e}"})
+        self._json(202, job)
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def main():
+    parser = argparse.ArgumentParser(description='resident wrc transformer service')
+    parser.add_argument('--port', type=int, default=Settings.SERVICE_PORT, help='http port to accept jobs on')
+    parser.add_argument('--io_workers', type=int, default=8, help='threads used for minio downloads/uploads')
+    parser.add_argument('--cpu_workers', type=int, default=None, help='processes used for html cleaning and hashing (default: cpu count)')
+    parser.add_argument('--html_cleaner', choices=['bs4', 'lxml'], default=Settings.HTML_CLEANER, help='html cleaning backend')
+    args = parser.parse_args()
+
+    clients_started = time.perf_counter()
+    transformer = Transformer(io_workers=args.io_workers, cpu_workers=args.cpu_workers, html_cleaner=args.html_cleaner)
+    clients_time = time.perf_counter() - clients_started
+
+    with transformer._pools() as pools:
+        transformer.pools = pools
+        service = TransformerService(transformer)
+        pools_time = service.warm_up()
+
+        ServiceHandler.service = service
+        httpd = ThreadingHTTPServer(('0.0.0.0', args.port), ServiceHandler)
+        # one-off costs a cli run pays every time, for comparing with the client's `measure`
+        service.startup = {
+            'imports': round(IMPORTS_DONE_AT - STARTED_AT, 3),
+            'clients': round(clients_time, 3),
+            'pools': round(pools_time, 3),
+            'total': round(time.perf_counter() - STARTED_AT, 3),
+        }
+        logger.info(f"transformer service listening on {args.port}, startup took {service.startup}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("stopping transformer service")
+        finally:
+            httpd.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import pymongo
+import logging
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from src.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+def lease_id(doc):
+    # one lease per write of a record: a re-scrape rewrites it (new main file, changed attachments, files that were
+    # missing on an earlier pass) so it gets a new lease and is looked at again, the transformer still skips it when
+    # none of its files changed. records written before updated_at existed fall back to scraped_at
+    written = doc.get('updated_at') or doc.get('scraped_at')
+    version = written.isoformat() if written else ''
+    return f"{(doc.get('ref_number') or '').strip()}:{doc.get('file_hash') or ''}:{version}"
+
+# leases on source records so several transformer workers can share a date range, see Transformer.work.
+# a lease is claimed atomically (upsert on its _id), kept alive by the owner's heartbeat and marked done once the
+# processed record is written. expired or failed leases can be claimed again, up to LEASE_MAX_ATTEMPTS times,
+# a failed one only after a backoff (LEASE_RETRY_BACKOFF seconds, doubled on every attempt)
+class LeaseService:
+    def __init__(self, db, owner):
+        self.collection = db[Settings.LEASE_COLLECTION]
+        self.owner = owner
+        self.ttl = timedelta(seconds=Settings.LEASE_TTL)
+        try:
+            self.collection.create_index([('published_at', pymongo.ASCENDING), ('status', pymongo.ASCENDING)])
+            self.collection.create_index([('owner', pymongo.ASCENDING), ('status', pymongo.ASCENDING)])
+        except Exception as e:
+            logger.warning(f"failed to create indexes on {Settings.LEASE_COLLECTION}: {e}")
+
+    def _claimable(self, now):
+        # expired leases, and failed ones whose backoff is over, with attempts left
+        return {
+            'attempts': {'$lt': Settings.LEASE_MAX_ATTEMPTS},
+            '$or': [
+                {'status': 'leased', 'expires_at': {'$lt': now}},
+                {'status': 'failed', 'retry_at': {'$not': {'$gt': now}}},
+            ],
+        }
+
+    def claim(self, docs):
+        # returns the docs this worker now holds. the filter only matches free leases, so for a lease someone
+        # else holds, finished, superseded or that is backing off the upsert hits the _id and fails
+        if not docs:
+            return []
+        claimable = self._claimable(datetime.utcnow())
+        operations = [
+            UpdateOne(
+                {'_id': lease_id(doc), **claimable},
+                {
+                    '$set': {
+                        'owner': self.owner,
+                        'status': 'leased',
+                        'expires_at': datetime.utcnow() + self.ttl,
+                        'source_id': doc['_id'],
+                        'ref_number': doc.get('ref_number'),
+                        'published_at': doc.get('published_at'),
+                    },
+                    '$inc': {'attempts': 1},
+                },
+                upsert=True
+            )
+            for doc in docs
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+            return list(docs)
+        except BulkWriteError as e:
+            lost = set()
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    logger.error(f"failed to claim lease {lease_id(docs[error['index']])}: {error.get('errmsg')}")
+                lost.add(error['index'])
+            return [doc for index, doc in enumerate(docs) if index not in lost]
+
+    def heartbeat(self):
+        result = self.collection.update_many(
+            {'owner': self.owner, 'status': 'leased'},
+            {'$set': {'expires_at': datetime.utcnow() + self.ttl}}
+        )
+        return result.modified_count
+
+    def complete(self, docs):
+        self._finish(docs, {'status': 'done', 'done_at': datetime.utcnow()})
+
+    def fail(self, docs):
+        # retry_at = now + backoff * 2^(attempts - 1), computed per lease by an update pipeline
+        now = datetime.utcnow()
+        backoff_ms = Settings.LEASE_RETRY_BACKOFF * 1000
+        self._finish(docs, [{'$set': {
+            'status': 'failed',
+            'failed_at': now,
+            'retry_at': {'$add': [now, {'$multiply': [backoff_ms, {'$pow': [2, {'$subtract': ['$attempts', 1]}]}]}]},
+        }}])
+
+    def supersede(self, ids):
+        # leases whose record is gone, has no file anymore or was re-scraped (a new file is a new lease)
+        if ids:
+            self.collection.update_many(
+                {'_id': {'$in': ids}, 'status': {'$in': ['leased', 'failed']}},
+                {'$set': {'status': 'superseded', 'superseded_at': datetime.utcnow()}}
+            )
+
+    def _finish(self, docs, update):
+        if docs:
+            # only leases still ours, one that expired meanwhile may already belong to another worker
+            self.collection.update_many(
+                {'_id': {'$in': [lease_id(doc) for doc in docs]}, 'owner': self.owner, 'status': 'leased'},
+                update if isinstance(update, list) else {'$set': update}
+            )
+
+    def reclaimable(self, start_date, end_date):
+        # leases in the range that were lost (expired) or failed and can be claimed again now, with their source ids
+        return list(self.collection.find(
+            {'published_at': {'$gte': start_date, '$lte': end_date}, **self._claimable(datetime.utcnow())},
+            {'source_id': 1}
+        ))
+
+    def retries_pending(self, start_date, end_date):
+        # failed leases in the range still backing off
+        return self.collection.count_documents({
+            'published_at': {'$gte': start_date, '$lte': end_date},
+            'status': 'failed',
+            'attempts': {'$lt': Settings.LEASE_MAX_ATTEMPTS},
+            'retry_at': {'$gt': datetime.utcnow()},
+        })
+
+    def others_active(self, start_date, end_date):
+        # leases in the range still held by live workers, they may still expire and need reclaiming
+        return self.collection.count_documents({
+            'published_at': {'$gte': start_date, '$lte': end_date},
+            'status': 'leased',
+            'owner': {'$ne': self.owner},
+            'expires_at': {'$gte': datetime.utcnow()},
+        })
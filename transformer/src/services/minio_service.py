@@ -1,9 +1,13 @@
 import io
+import json
 import logging
 import os
 from urllib.parse import urlparse
 from minio import Minio
+from minio.commonconfig import ComposeSource
 from src.settings import Settings
+from src.utils.codec import check_codec, compress, decompress, storage_metadata, stored_encoding
+from src.utils.utils import HashingReader
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,8 @@ class MinioService:
                 secure=False
             )
             self._ensure_bucket(Settings.TARGET_BUCKET)
+            # processed html is compressed with this codec, see src/utils/codec.py
+            self.codec = check_codec(Settings.STORAGE_CODEC)
             logger.info("connected to minio")
         except Exception as e:
             logger.error(f"failed to connect to minio: {e}")
@@ -36,7 +42,8 @@ class MinioService:
             object_name = parsed.path.lstrip('/')
             
             response = self.client.get_object(bucket_name, object_name)
-            content = response.read()
+            # urllib3 would decode gzip on its own (but not zstd without the package), decode it ourselves either way
+            content = decompress(response.read(decode_content=False), stored_encoding(response.headers))
             response.close()
             response.release_conn()
             return content, object_name
@@ -57,16 +64,114 @@ class MinioService:
             logger.error(f"error listing files in {folder_path_s3}: {e}")
             return []
 
+    def list_files_with_etags(self, folder_path_s3):
+        # same as list_files but keeps the etag of each object, used to tell if a case changed since the last run
+        try:
+            parsed = urlparse(folder_path_s3)
+            bucket_name = parsed.netloc
+            prefix = parsed.path.lstrip('/')
+            if not prefix.endswith('/'):
+                 prefix += '/'
+            objects = self.client.list_objects(bucket_name, prefix=prefix, recursive=True)
+            return {f"s3://{bucket_name}/{obj.object_name}": obj.etag for obj in objects}
+        except Exception as e:
+            logger.error(f"error listing files in {folder_path_s3}: {e}")
+            return {}
+
+    def get_manifest(self, partition):
+        # manifests/{partition}.json is written by the scraper, maps ref_number -> objects (key, size, etag, content type)
+        try:
+            response = self.client.get_object(Settings.SOURCE_BUCKET, f"{Settings.MANIFEST_PREFIX}{partition}.json")
+            try:
+                return json.loads(response.read())
+            finally:
+                response.close()
+                response.release_conn()
+        except Exception as e:
+            logger.debug(f"no manifest for partition {partition}: {e}")
+            return None
+
+    def file_exists(self, filename):
+        try:
+            self.client.stat_object(Settings.TARGET_BUCKET, filename)
+            return True
+        except Exception:
+            return False
+
     def upload_file(self, filename, content, content_type='application/octet-stream'):
+        # only text is compressed, the caller hashes the content before it gets here
+        codec = self.codec if self.codec != 'none' and content_type.startswith('text/') else None
+        if codec:
+            content = compress(content, codec)
         try:
             self.client.put_object(
                 Settings.TARGET_BUCKET,
                 filename,
                 io.BytesIO(content),
                 len(content),
-                content_type=content_type
+                content_type=content_type,
+                metadata=storage_metadata(codec),
+                part_size=Settings.MINIO_PART_SIZE
             )
             return f"s3://{Settings.TARGET_BUCKET}/{filename}"
         except Exception as e:
             logger.error(f"failed to upload {filename}: {e}")
             raise
+
+    def upload_local_file(self, filename, path, content_type='application/octet-stream'):
+        # multipart upload straight from disk, used for the export files
+        try:
+            self.client.fput_object(
+                Settings.TARGET_BUCKET,
+                filename,
+                path,
+                content_type=content_type,
+                part_size=Settings.MINIO_PART_SIZE
+            )
+            return f"s3://{Settings.TARGET_BUCKET}/{filename}"
+        except Exception as e:
+            logger.error(f"failed to upload {path} to {filename}: {e}")
+            raise
+
+    def copy_file(self, file_path_s3, filename):
+        # server side copy, the bytes never leave minio. compose_object does a plain CopyObject
+        # and switches to UploadPartCopy on its own for objects over 5GiB
+        try:
+            parsed = urlparse(file_path_s3)
+            self.client.compose_object(
+                Settings.TARGET_BUCKET,
+                filename,
+                [ComposeSource(parsed.netloc, parsed.path.lstrip('/'))]
+            )
+            return f"s3://{Settings.TARGET_BUCKET}/{filename}"
+        except Exception as e:
+            logger.error(f"failed to copy {file_path_s3} to {filename}: {e}")
+            raise
+
+    def stream_file(self, file_path_s3, filename, content_type='application/octet-stream'):
+        # get_object -> put_object one part at a time while hashing, memory stays at about one part whatever the file size.
+        # a compressed source is copied compressed (with its encoding) and hashed on the decompressed bytes
+        parsed = urlparse(file_path_s3)
+        response = None
+        try:
+            response = self.client.get_object(parsed.netloc, parsed.path.lstrip('/'))
+            response.decode_content = False
+            encoding = stored_encoding(response.headers)
+            reader = HashingReader(response, encoding)
+            self.client.put_object(
+                Settings.TARGET_BUCKET,
+                filename,
+                reader,
+                -1,
+                content_type=content_type,
+                metadata=storage_metadata(encoding),
+                part_size=Settings.MINIO_PART_SIZE
+            )
+            return f"s3://{Settings.TARGET_BUCKET}/{filename}", reader.hexdigest()
+        except Exception as e:
+            logger.error(f"failed to stream {file_path_s3} to {filename}: {e}")
+            raise
+        finally:
+            if response is not None:
+                response.close()
+                response.release_conn()
@@ -1,5 +1,9 @@
 import pymongo
 import logging
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from src.settings import Settings
 
 logger = logging.getLogger(__name__)
@@ -9,16 +13,110 @@ class MongoService:
         try:
             self.client = pymongo.MongoClient(Settings.MONGO_URI)
             self.db = self.client[Settings.MONGO_DB_NAME]
+            # processed records are written in bulk, keyed by ref_number so repeats in a batch collapse into one write
+            self.pending = {}
+            self.last_flush = time.monotonic()
             logger.info("connected to mongodb")
         except Exception as e:
             logger.error(f"failed to connect to mongodb: {e}")
             raise
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        # partial filters so records without a ref number (or url) don't collide on null
+        indexes = [
+            ([('published_at', pymongo.ASCENDING)], {}),
+            ([('ref_number', pymongo.ASCENDING)], {'unique': True, 'partialFilterExpression': {'ref_number': {'$type': 'string'}}}),
+            ([('url', pymongo.ASCENDING)], {'unique': True, 'partialFilterExpression': {'url': {'$type': 'string'}}}),
+        ]
+        for collection_name in [Settings.SOURCE_COLLECTION, Settings.TARGET_COLLECTION]:
+            for keys, options in indexes:
+                try:
+                    self.db[collection_name].create_index(keys, **options)
+                except Exception as e:
+                    logger.warning(f"failed to create index {keys} on {collection_name}: {e}")
+        # follow mode polls the source on updated_at (the scraper's write time) when change streams aren't available,
+        # scraped_at for records written before the scraper set it
+        for field in ['updated_at', 'scraped_at']:
+            try:
+                self.db[Settings.SOURCE_COLLECTION].create_index([(field, pymongo.ASCENDING)])
+            except Exception as e:
+                logger.warning(f"failed to create index {field} on {Settings.SOURCE_COLLECTION}: {e}")
 
     def get_records_by_date_range(self, start_date, end_date):
-        pipeline = [
+        # published_at is indexed, records scraped before it existed need `python -m src.backfill` first
+        query = {
+            "published_at": {
+                "$gte": start_date,
+                "$lte": end_date
+            },
+            "file_path": {"$exists": True, "$ne": None}
+        }
+        return self.db[Settings.SOURCE_COLLECTION].find(query)
+
+    def get_records_by_ids(self, ids):
+        return list(self.db[Settings.SOURCE_COLLECTION].find({"_id": {"$in": ids}, "file_path": {"$exists": True, "$ne": None}}))
+
+    def get_processed_sources(self, start_date, end_date):
+        # what each processed record was built from, keyed by the (stripped) ref number
+        cursor = self.db[Settings.TARGET_COLLECTION].find(
+            {"published_at": {"$gte": start_date, "$lte": end_date}},
+            {"ref_number": 1, "source_hash": 1, "source_etags": 1}
+        )
+        return {
+            doc['ref_number'].strip(): {'source_hash': doc.get('source_hash'), 'source_etags': doc.get('source_etags')}
+            for doc in cursor if doc.get('ref_number')
+        }
+
+    def get_processed_sources_for(self, ref_numbers):
+        # same as get_processed_sources for the given records only (follow mode batches)
+        cursor = self.db[Settings.TARGET_COLLECTION].find(
+            {"ref_number": {"$in": [ref_number for ref_number in ref_numbers if ref_number]}},
+            {"ref_number": 1, "source_hash": 1, "source_etags": 1}
+        )
+        return {
+            doc['ref_number'].strip(): {'source_hash': doc.get('source_hash'), 'source_etags': doc.get('source_etags')}
+            for doc in cursor if doc.get('ref_number')
+        }
+
+    def watch_source(self, resume_token=None):
+        # inserts/updates/replaces of the source with the full document, raises OperationFailure on a standalone mongo
+        return self.db[Settings.SOURCE_COLLECTION].watch(
+            [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+            full_document='updateLookup',
+            resume_after=resume_token,
+            max_await_time_ms=500
+        )
+
+    def get_source_records_since(self, updated_after):
+        query = {"file_path": {"$exists": True, "$ne": None}}
+        if updated_after:
+            query["$or"] = [
+                {"updated_at": {"$gt": updated_after}},
+                {"updated_at": {"$exists": False}, "scraped_at": {"$gt": updated_after}},
+            ]
+        return self.db[Settings.SOURCE_COLLECTION].find(query).sort("updated_at", pymongo.ASCENDING)
+
+    def get_follow_state(self):
+        return self.db[Settings.STATE_COLLECTION].find_one({"_id": "follow"}) or {}
+
+    def save_follow_state(self, resume_token=None, watermark=None):
+        update = {"updated_at": datetime.utcnow()}
+        if resume_token is not None:
+            update["resume_token"] = resume_token
+        if watermark is not None:
+            update["watermark"] = watermark
+        self.db[Settings.STATE_COLLECTION].update_one({"_id": "follow"}, {"$set": update}, upsert=True)
+
+    def clear_resume_token(self):
+        self.db[Settings.STATE_COLLECTION].update_one({"_id": "follow"}, {"$unset": {"resume_token": ""}})
+
+    def backfill_published_at(self):
+        # one-off migration, parses the published_date string server side for records that don't have published_at yet
+        update = [
             {
-                "$addFields": {
-                    "date_obj": {
+                "$set": {
+                    "published_at": {
                         "$dateFromString": {
                             "dateString": {"$trim": {"input": "$published_date"}},
                             "format": "%d/%m/%Y",
@@ -27,31 +125,71 @@ class MongoService:
                         }
                     }
                 }
-            },
-            {
-                "$match": {
-                    "date_obj": {
-                        "$gte": start_date,
-                        "$lte": end_date
-                    },
-                    "file_path": {"$exists": True, "$ne": None}
-                }
             }
         ]
-        return self.db[Settings.SOURCE_COLLECTION].aggregate(pipeline)
+        counts = {}
+        for collection_name in [Settings.SOURCE_COLLECTION, Settings.TARGET_COLLECTION]:
+            result = self.db[collection_name].update_many(
+                {"published_at": {"$exists": False}, "published_date": {"$type": "string"}},
+                update
+            )
+            counts[collection_name] = result.modified_count
+        return counts
+
+    def get_records_to_export(self, start_date, end_date, everything=False):
+        # processed records never exported or reprocessed since their last export, in published order so
+        # each partition comes out in one go
+        query = {"published_at": {"$gte": start_date, "$lte": end_date}}
+        if not everything:
+            query["$or"] = [
+                {"exported_at": {"$exists": False}},
+                {"$expr": {"$gt": ["$processed_at", "$exported_at"]}},
+            ]
+        return self.db[Settings.TARGET_COLLECTION].find(query, {"source_etags": 0}).sort("published_at", pymongo.ASCENDING)
+
+    def mark_exported(self, ids, exported_at):
+        for start in range(0, len(ids), 1000):
+            self.db[Settings.TARGET_COLLECTION].update_many(
+                {"_id": {"$in": ids[start:start + 1000]}},
+                {"$set": {"exported_at": exported_at}}
+            )
 
     def upsert_processed_record(self, record):
+        record_to_save = record.copy()
+        record_to_save.pop('date_obj', None)
+        record_to_save.pop('_id', None)
+        record_to_save['processed_at'] = datetime.utcnow()
+
+        self.pending[record['ref_number']] = record_to_save
+
+        # returns the ref numbers that couldn't be written when this triggered a flush
+        if len(self.pending) >= Settings.MONGO_BATCH_SIZE or time.monotonic() - self.last_flush >= Settings.MONGO_FLUSH_INTERVAL:
+            return self.flush()
+        return []
+
+    def flush(self):
+        # returns the ref numbers that couldn't be written
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return []
+
+        ref_numbers = list(self.pending)
+        operations = [
+            UpdateOne({'ref_number': ref_number}, {'$set': record}, upsert=True)
+            for ref_number, record in self.pending.items()
+        ]
+        self.pending = {}
+
         try:
-            record_to_save = record.copy()
-            record_to_save.pop('date_obj', None)
-            record_to_save.pop('_id', None)
-            from datetime import datetime
-            record_to_save['processed_at'] = datetime.utcnow()
-            
-            self.db[Settings.TARGET_COLLECTION].update_one(
-                {'ref_number': record['ref_number']},
-                {'$set': record_to_save},
-                upsert=True
-            )
+            self.db[Settings.TARGET_COLLECTION].bulk_write(operations, ordered=False)
+            logger.debug(f"flushed {len(operations)} processed records")
+        except BulkWriteError as e:
+            failed = []
+            for error in e.details.get('writeErrors', []):
+                failed.append(ref_numbers[error['index']])
+                logger.error(f"failed to upsert record {ref_numbers[error['index']]}: {error.get('errmsg')}")
+            return failed
         except Exception as e:
-            logger.error(f"failed to upsert record {record.get('ref_number')}: {e}")
+            logger.error(f"failed to flush {len(operations)} processed records: {e}")
+            return ref_numbers
+        return []
@@ -9,6 +9,13 @@ class Settings:
     MONGO_DB_NAME = os.getenv('MONGO_DATABASE', 'wrc_db')
     SOURCE_COLLECTION = 'wrc_decisions'
     TARGET_COLLECTION = 'wrc_decisions_processed'
+    # transformer bookkeeping (follow mode resume token / watermark)
+    STATE_COLLECTION = 'transformer_state'
+    # worker mode leases (see src/services/lease_service.py)
+    LEASE_COLLECTION = 'transformer_leases'
+    # processed records are upserted in bulk once the batch is full or the interval (seconds) passes
+    MONGO_BATCH_SIZE = int(os.getenv('MONGO_BATCH_SIZE', '100'))
+    MONGO_FLUSH_INTERVAL = float(os.getenv('MONGO_FLUSH_INTERVAL', '5'))
 
     # minio
     MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
@@ -16,3 +23,39 @@ class Settings:
     MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin')
     SOURCE_BUCKET = os.getenv('MINIO_BUCKET', 'wrc-decisions')
     TARGET_BUCKET = 'wrc-processed'
+    # large objects are streamed in parts of this size (bytes), minio requires at least 5MiB
+    MINIO_PART_SIZE = max(int(os.getenv('MINIO_PART_SIZE', str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+    # per partition object manifests written by the scraper in the source bucket
+    MANIFEST_PREFIX = 'manifests/'
+    # compression of the processed html: none, gzip or zstd (needs the zstandard package). objects are read
+    # by their Content-Encoding whatever this is set to, so it can be switched on an existing bucket
+    STORAGE_CODEC = os.getenv('STORAGE_CODEC', 'none')
+    # shared attachments: case folders hold {name}.ref.json references to blobs stored once under BLOB_PREFIX
+    BLOB_PREFIX = os.getenv('BLOB_PREFIX', 'blobs/')
+    BLOB_REF_SUFFIX = '.ref.json'
+
+    # html cleaner backend (bs4 or lxml), run `python -m src.check_cleaner` before switching
+    HTML_CLEANER = os.getenv('HTML_CLEANER', 'bs4')
+
+    # follow mode: a batch is processed once it has FOLLOW_BATCH_SIZE records or its first record waited FOLLOW_BATCH_WAIT seconds.
+    # without change streams (standalone mongo) updated_at (the scraper's write time) is polled every FOLLOW_POLL_INTERVAL
+    # seconds, looking FOLLOW_POLL_OVERLAP seconds behind the watermark for writes that became visible late
+    FOLLOW_BATCH_SIZE = int(os.getenv('FOLLOW_BATCH_SIZE', '50'))
+    FOLLOW_BATCH_WAIT = float(os.getenv('FOLLOW_BATCH_WAIT', '2'))
+    FOLLOW_POLL_INTERVAL = float(os.getenv('FOLLOW_POLL_INTERVAL', '2'))
+    FOLLOW_POLL_OVERLAP = float(os.getenv('FOLLOW_POLL_OVERLAP', '30'))
+
+    # worker mode: a lease expires LEASE_TTL seconds after its last heartbeat, workers claim LEASE_BATCH_SIZE records at once
+    # and a record that keeps failing (or keeps losing its worker) is given up after LEASE_MAX_ATTEMPTS claims.
+    # a failed record is retried after LEASE_RETRY_BACKOFF seconds, doubled on every attempt
+    LEASE_TTL = float(os.getenv('LEASE_TTL', '120'))
+    LEASE_BATCH_SIZE = int(os.getenv('LEASE_BATCH_SIZE', '20'))
+    LEASE_MAX_ATTEMPTS = int(os.getenv('LEASE_MAX_ATTEMPTS', '3'))
+    LEASE_RETRY_BACKOFF = float(os.getenv('LEASE_RETRY_BACKOFF', '30'))
+
+    # parquet export (src/export.py): dataset prefix in TARGET_BUCKET and rows per row group
+    EXPORT_PREFIX = os.getenv('EXPORT_PREFIX', 'exports/decisions/')
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+
+    # resident service (src/server.py)
+    SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8082'))
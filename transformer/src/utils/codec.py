@@ -0,0 +1,52 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# optional compression of the processed html (STORAGE_CODEC), the same codecs the scraper stores raw pages with.
+# compressed objects carry the codec as Content-Encoding (and x-amz-meta-codec), hashes are always of the
+# uncompressed content. objects without the header (stored before, or never compressed) are read as they are
+CODECS = ('none', 'gzip', 'zstd')
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"unknown storage codec {codec}, expected one of {', '.join(CODECS)}")
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("storage codec zstd needs the zstandard package (pip install zstandard)")
+    return codec
+
+def stored_encoding(headers):
+    # codec an object was stored with, from its response/stat headers
+    encoding = headers.get('Content-Encoding') or headers.get('x-amz-meta-codec')
+    return encoding if encoding in ('gzip', 'zstd') else None
+
+def storage_metadata(codec):
+    # put_object metadata for a compressed object, minio sends Content-Encoding as a header and the rest as x-amz-meta-*
+    return {'Content-Encoding': codec, 'codec': codec} if codec else None
+
+def compress(data, codec):
+    if codec == 'gzip':
+        return zlib.compress(data, 6, 31)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+class Decompressor:
+    # streaming decompressor, used to hash a compressed object while copying it as is
+    def __init__(self, encoding):
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(31)
+        elif encoding == 'zstd':
+            if zstandard is None:
+                raise ValueError("object is zstd compressed, install the zstandard package to read it")
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            self._decompressor = None
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data) if self._decompressor else data
+
+def decompress(data, encoding):
+    return Decompressor(encoding).decompress(data)
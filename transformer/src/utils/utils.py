@@ -1,11 +1,33 @@
 import hashlib
-from bs4 import BeautifulSoup
+import lxml.html
+from bs4 import BeautifulSoup, NavigableString, Comment, UnicodeDammit
+from src.utils.codec import Decompressor
 
-def process_html_content(content):
+REMOVED_TAGS = ['nav', 'header', 'footer', 'script', 'style']
+# elements that end a line in the exported plain text
+BLOCK_TAGS = ['br', 'p', 'div', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol', 'blockquote']
+BLOCK_BREAK = '\u2029'
+# table cells are kept apart on their row's line
+CELL_TAGS = ['td', 'th']
+
+# first div.col-sm-9 that wasn't going to be removed with its nav/header/footer ancestor
+CONTENT_DIV_XPATH = (
+    '//div[contains(concat(" ", normalize-space(@class), " "), " col-sm-9 ")]'
+    '[not(ancestor::nav or ancestor::header or ancestor::footer)]'
+)
+
+def process_html_content(content, backend='bs4'):
+    cleaner = CLEANERS.get(backend)
+    if cleaner is None:
+        raise ValueError(f"unknown html cleaner backend: {backend}")
+    return cleaner(content)
+
+def _clean_with_bs4(content):
+    # reference implementation, pure python and slow but this is what the stored content was produced with
     soup = BeautifulSoup(content, 'html.parser')
     
     # remove navigation, headers, footers (just in case)
-    for tag in soup(['nav', 'header', 'footer', 'script', 'style']):
+    for tag in soup(REMOVED_TAGS):
         tag.decompose()
 
     # the main content based on observations are inside this div
@@ -17,6 +39,98 @@ def process_html_content(content):
         return str(soup.body).encode('utf-8')
     return str(soup).encode('utf-8')
 
+def _clean_with_lxml(content):
+    # goes straight to the content div and only strips tags inside it instead of walking the whole page
+    try:
+        # decode the same way bs4 does, lxml would otherwise guess latin-1 for pages without a charset
+        markup = UnicodeDammit(content, is_html=True).unicode_markup if isinstance(content, bytes) else content
+        doc = lxml.html.document_fromstring(markup)
+        matches = doc.xpath(CONTENT_DIV_XPATH)
+    except Exception:
+        matches = None
+
+    if not matches:
+        # pages without the content div (or that lxml refuses) are rare, the reference cleaner handles them
+        return _clean_with_bs4(content)
+
+    root = matches[0]
+    for tag in root.xpath('.//' + '|.//'.join(REMOVED_TAGS)):
+        # drop_tree keeps the text that follows the tag, same as bs4's decompose
+        tag.drop_tree()
+
+    return lxml.html.tostring(root, encoding='unicode', with_tail=False).encode('utf-8')
+
+CLEANERS = {
+    'bs4': _clean_with_bs4,
+    'lxml': _clean_with_lxml,
+}
+
+def dom_signature(content):
+    # normalized tree (tags, attributes, whitespace collapsed text) used to compare the output of two cleaners
+    def walk(node):
+        children = []
+        for child in node.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                text = ' '.join(child.split())
+                if text:
+                    children.append(text)
+            else:
+                children.append(walk(child))
+        attrs = tuple(sorted(
+            (name, ' '.join(value) if isinstance(value, list) else value)
+            for name, value in node.attrs.items()
+        ))
+        return (node.name, attrs, tuple(children))
+
+    return walk(BeautifulSoup(content, 'html.parser'))
+
+def extract_text(content):
+    # plain text of the decision for the parquet export. processed pages are already the div.col-sm-9 content,
+    # a raw page is narrowed down to it first. one line per block element, whitespace collapsed inside them
+    if not content:
+        return None
+    try:
+        markup = UnicodeDammit(content, is_html=True).unicode_markup if isinstance(content, bytes) else content
+        root = lxml.html.fragment_fromstring(markup, create_parent='div')
+    except Exception:
+        return None
+    matches = root.xpath('.' + CONTENT_DIV_XPATH[1:])
+    if matches:
+        root = matches[0]
+    for tag in root.xpath('.//' + '|.//'.join(REMOVED_TAGS)):
+        tag.drop_tree()
+    # mark where blocks end, the newlines already in the markup are just whitespace
+    for tag in root.xpath('.//' + '|.//'.join(BLOCK_TAGS)):
+        tag.tail = BLOCK_BREAK + (tag.tail or '')
+    for tag in root.xpath('.//' + '|.//'.join(CELL_TAGS)):
+        tag.tail = ' ' + (tag.tail or '')
+    lines = (' '.join(line.split()) for line in root.text_content().split(BLOCK_BREAK))
+    return '\n'.join(line for line in lines if line)
+
+class HashingReader:
+    # file-like wrapper that computes the sha256 of everything read through it (of the decompressed bytes when
+    # the stream is a compressed object, so it matches the hash of the same content stored uncompressed)
+    def __init__(self, stream, encoding=None):
+        self.stream = stream
+        self.hasher = hashlib.sha256()
+        self.decompressor = Decompressor(encoding)
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hasher.update(self.decompressor.decompress(data))
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
 def calculate_hash(content):
     # uses sha256 to calculate hash
     return hashlib.sha256(content).hexdigest()
+
+def clean_and_hash(content, is_html, with_hash, backend='bs4'):
+    # cpu bound part of the transformer, kept top level so it can run in a process pool
+    new_content = process_html_content(content, backend) if is_html else content
+    file_hash = calculate_hash(new_content) if with_hash else None
+    return new_content, file_hash